@@ -1,10 +1,35 @@
-import sys
+import argparse
 
 from chip8.chip8 import Chip8
 
 if __name__ == "__main__":
-    game = sys.argv[1]
-    chip8 = Chip8()
-    chip8.load_game(game)
+    parser = argparse.ArgumentParser(description="Play a CHIP-8 game")
+    parser.add_argument("game")
+    parser.add_argument("--record", help="save the key presses and seed of this session to a file, "
+                                         "replay it with python3 -m chip8.replay")
+    parser.add_argument("--video", help="save every frame of this session to a file, "
+                                        "export it with python3 -m chip8.video")
+    args = parser.parse_args()
+
+    recorder = None
+    if args.record:
+        from chip8.graphics import PygameFrontend
+        from chip8.replay import RecordingFrontend
+        recorder = RecordingFrontend(PygameFrontend())
+
+    chip8 = Chip8(frontend=recorder)
+    chip8.load_game(args.game)
     chip8.initialize()
-    chip8.loop()
+
+    video = None
+    if args.video:
+        from chip8.video import VideoRecorder
+        video = VideoRecorder(chip8)
+
+    try:
+        chip8.loop()
+    finally:
+        if recorder is not None:
+            recorder.save(args.record, chip8, args.game)
+        if video is not None:
+            video.save(args.video)
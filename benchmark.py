@@ -0,0 +1,261 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from chip8.chip8 import Chip8, Idle
+from chip8.decoder import Decoder
+from chip8.engines import ENGINES, attach
+from chip8.frontend import ScriptedFrontend
+
+ROOT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+GAMES_DIRECTORY = os.path.join(ROOT_DIRECTORY, "games")
+
+# A headless instance from a fresh interpreter to the end of its first frame,
+# it fails when anything pulled pygame in
+STARTUP_SCRIPT = """
+import sys
+from chip8.chip8 import Chip8
+from chip8.frontend import HeadlessFrontend
+chip8 = Chip8(frontend=HeadlessFrontend())
+chip8.load_game(sys.argv[1])
+chip8.initialize()
+chip8.run_frame()
+assert "pygame" not in sys.modules, "pygame imported by a headless instance"
+"""
+
+# Seconds a headless instance may add to the interpreter's own startup
+STARTUP_BUDGET = 0.05
+
+
+class TimedChip8(Chip8):
+    # Interpreter loop that also times every instruction by op code class,
+    # only used for the per-class breakdown since timing costs more than
+    # most instructions
+
+    def __init__(self, frontend=None, seed=None):
+        super().__init__(frontend, seed)
+        # Op code class, e.g. "Dxyn" -> [count, nanoseconds]
+        self.opcode_times = {}
+        self.classes = {}
+
+    def execute(self, cycles):
+        memory = self.memory
+        classes = self.classes
+        times = self.opcode_times
+        clock = time.perf_counter_ns
+        while cycles > 0:
+            pc = self.PC
+            op_code = (memory[pc] << 8) | memory[pc + 1]
+            entry = self._dispatch.get(op_code)
+            if entry is None:
+                entry = self.predecode(op_code)
+            handler, x, y, kk, nnn, n = entry
+            start = clock()
+            try:
+                handler(self, x, y, kk, nnn, n)
+                self.PC += 2
+                cycles -= 1
+            except Idle as idle:
+                cycles = self.skip_idle(idle, cycles - 1)
+            elapsed = clock() - start
+
+            if op_code not in classes:
+                classes[op_code] = Decoder.decode(op_code).value
+            record = times.setdefault(classes[op_code], [0, 0])
+            record[0] += 1
+            record[1] += elapsed
+
+
+def create(rom_path, cycles, engine, chip8_class=Chip8):
+    # A headless machine with the same seed and scripted input on every run
+    chip8 = chip8_class(seed=0)
+    frames = cycles // chip8.cycles_per_frame + 1
+    chip8.frontend = ScriptedFrontend(ScriptedFrontend.round_robin(frames))
+    chip8.load_game(rom_path)
+    chip8.initialize()
+    attach(chip8, engine)
+    return chip8
+
+
+def run_until_error(chip8, cycles):
+    # Some ROMs crash the machine after a while, e.g. with a stack overflow,
+    # the benchmark then only counts what ran before that
+    try:
+        chip8.run(cycles)
+    except (IndexError, ValueError) as error:
+        return f"{type(error).__name__}: {error}"
+    return None
+
+
+def benchmark_rom(rom_path, cycles, engine, repeat):
+    # Instructions and frames per second, best of `repeat` runs
+    best = None
+    for _ in range(repeat):
+        chip8 = create(rom_path, cycles, engine)
+        start = time.perf_counter()
+        error = run_until_error(chip8, cycles)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best[0]:
+            best = (elapsed, chip8.cycle_count, chip8.idle_cycles, chip8.frame_count, error)
+    elapsed, cycles, idle_cycles, frames, error = best
+    # Idle loops skipped and halted frames fast-forwarded count as cycles,
+    # but the speed is only measured on the instructions actually executed
+    executed = cycles - idle_cycles
+
+    # Time per op code class, always measured on the interpreter
+    chip8 = create(rom_path, cycles, "interpreter", TimedChip8)
+    run_until_error(chip8, cycles)
+    total_time = sum(record[1] for record in chip8.opcode_times.values()) or 1
+    opcode_classes = {}
+    for name, (count, nanoseconds) in sorted(chip8.opcode_times.items(), key=lambda item: -item[1][1]):
+        opcode_classes[name] = {
+            "count": count,
+            "seconds": nanoseconds / 1e9,
+            "share": nanoseconds / total_time,
+        }
+
+    # Peak memory of creating and running one instance
+    tracemalloc.start()
+    chip8 = create(rom_path, cycles, engine)
+    run_until_error(chip8, cycles)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "cycles": cycles,
+        "executed": executed,
+        "idle_cycles": idle_cycles,
+        "error": error,
+        "seconds": elapsed,
+        "instructions_per_second": executed / elapsed,
+        "frames": frames,
+        "frames_per_second": frames / elapsed,
+        "peak_memory_bytes": peak_memory,
+        "opcode_classes": opcode_classes,
+    }
+
+
+def run_benchmarks(rom_paths, cycles, engine, repeat):
+    results = {}
+    total_cycles = 0
+    total_time = 0
+    for rom_path in rom_paths:
+        name = os.path.basename(rom_path)
+        results[name] = benchmark_rom(rom_path, cycles, engine, repeat)
+        total_cycles += results[name]["executed"]
+        total_time += results[name]["seconds"]
+        print_result(name, results[name])
+
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "engine": engine,
+        "cycles": cycles,
+        "instructions_per_second": total_cycles / total_time if total_time else 0,
+        "roms": results,
+    }
+
+
+def measure_startup(rom_path, repeat):
+    # Fastest cold start of a headless instance, and of a bare interpreter
+    def fastest(arguments):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable] + arguments, cwd=ROOT_DIRECTORY, check=True)
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        return best
+
+    interpreter = fastest(["-c", "pass"])
+    instance = fastest(["-c", STARTUP_SCRIPT, rom_path])
+    return {
+        "interpreter_seconds": interpreter,
+        "instance_seconds": instance,
+        "startup_seconds": instance - interpreter,
+    }
+
+
+def print_result(name, result):
+    top = ", ".join(f"{op} {stats['share']:.0%}" for op, stats in list(result["opcode_classes"].items())[:3])
+    print(f"{name:<18} {result['instructions_per_second']:>12,.0f} ips "
+          f"{result['frames_per_second']:>10,.0f} fps "
+          f"{result['peak_memory_bytes'] / 1024:>8,.0f} KiB   {top}", file=sys.stderr)
+    if result["idle_cycles"]:
+        print(f"{'':<18} {result['idle_cycles']:,} of {result['cycles']:,} cycles skipped as idle", file=sys.stderr)
+    if result["error"]:
+        print(f"{'':<18} stopped after {result['cycles']:,} cycles, {result['error']}", file=sys.stderr)
+
+
+def compare(report, baseline, threshold):
+    # Names of the ROMs at least `threshold` slower than in the baseline
+    regressions = []
+    for name, result in report["roms"].items():
+        if name not in baseline["roms"]:
+            continue
+        before = baseline["roms"][name]["instructions_per_second"]
+        after = result["instructions_per_second"]
+        if not before:
+            # Nothing ran in the baseline, there is no speed to compare
+            continue
+        change = after / before - 1
+        print(f"{name:<18} {before:>12,.0f} -> {after:>12,.0f} ips {change:+.1%}", file=sys.stderr)
+        if change < -threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the emulator on the bundled games, headless")
+    parser.add_argument("roms", nargs="*", help="ROM files, all of games/ by default")
+    parser.add_argument("--cycles", type=int, default=100000, help="instructions to run per ROM")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per ROM, the fastest one is reported")
+    parser.add_argument("--engine", choices=ENGINES, default="interpreter")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--compare", help="JSON report of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="slowdown that counts as a regression, 0.1 is 10%%")
+    parser.add_argument("--startup-budget", type=float, default=STARTUP_BUDGET,
+                        help="seconds a headless instance may add to the Python startup")
+    args = parser.parse_args()
+
+    rom_paths = args.roms or sorted(glob.glob(os.path.join(GAMES_DIRECTORY, "*.ch8")))
+    report = run_benchmarks(rom_paths, args.cycles, args.engine, args.repeat)
+    print(f"{'total':<18} {report['instructions_per_second']:>12,.0f} ips", file=sys.stderr)
+
+    report["startup"] = measure_startup(rom_paths[0], max(args.repeat, 5))
+    startup = report["startup"]["startup_seconds"]
+    print(f"{'startup':<18} {startup * 1000:>12,.1f} ms over the interpreter's "
+          f"{report['startup']['interpreter_seconds'] * 1000:,.1f} ms", file=sys.stderr)
+    over_budget = startup > args.startup_budget
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if over_budget:
+        print(f"Startup is over the budget of {args.startup_budget * 1000:,.0f} ms", file=sys.stderr)
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}", file=sys.stderr)
+
+    if over_budget or regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import hashlib
+import sys
+
+from chip8.chip8 import Chip8
+from chip8.decoder import Decoder, OpCodes
+
+SKIPS = (
+    OpCodes._3XKK_SE_VX_BYTE,
+    OpCodes._4XKK_SNE_VX_BYTE,
+    OpCodes._5XY0_SE_VX_VY,
+    OpCodes._9XY0_SNE_VX_VY,
+    OpCodes._E09E_SKP_VX,
+    OpCodes._EXA1_SKPN_VX,
+)
+
+
+class Analysis:
+    # The static control flow of a ROM:
+    #   blocks            block start -> end, the address after its last instruction
+    #   successors        block start -> block starts it can continue at
+    #   calls             subroutine entry (0x200 for the main program) -> entries it calls
+    #   indirect_jumps    addresses of BNNN, whose targets are only known at run time
+    #   data_references   addresses loaded into I by ANNN
+    #   code              addresses of every reachable instruction
+    #   data              (start, end) ranges of the ROM that are never executed
+
+    def __init__(self, rom_sha256, blocks, successors, calls, indirect_jumps, data_references, code, data):
+        self.rom_sha256 = rom_sha256
+        self.blocks = blocks
+        self.successors = successors
+        self.calls = calls
+        self.indirect_jumps = indirect_jumps
+        self.data_references = data_references
+        self.code = code
+        self.data = data
+
+
+def analyze(rom):
+    # Follow every path from 0x200 through jumps, calls and skips
+    memory = bytearray(Chip8.MEMORY_SIZE)
+    memory[Chip8.PROGRAM_START:Chip8.PROGRAM_START + len(rom)] = rom
+    end_of_rom = Chip8.PROGRAM_START + len(rom)
+
+    # Instruction address -> addresses it continues at
+    flow = {}
+    leaders = {Chip8.PROGRAM_START}
+    calls = {Chip8.PROGRAM_START: set()}
+    indirect_jumps = set()
+    data_references = set()
+
+    # Addresses a path reached that hold no valid instruction
+    invalid = set()
+
+    # (address, subroutine it belongs to)
+    pending = [(Chip8.PROGRAM_START, Chip8.PROGRAM_START)]
+    while pending:
+        pc, entry = pending.pop()
+        if pc in flow or pc in invalid:
+            continue
+        if pc < Chip8.PROGRAM_START or pc + 1 >= end_of_rom:
+            # Paths leaving the ROM are not followed
+            continue
+        op_code = (memory[pc] << 8) | memory[pc + 1]
+        instruction = Decoder.decode(op_code)
+        nnn = op_code & 0x0FFF
+
+        if instruction == OpCodes._NO_OPCODE:
+            # Not code after all, the path ends here
+            invalid.add(pc)
+            continue
+        elif instruction == OpCodes._1NNN_JP_ADDR:
+            targets = (nnn,)
+        elif instruction == OpCodes._2NNN_CALL_ADDR:
+            calls.setdefault(entry, set()).add(nnn)
+            calls.setdefault(nnn, set())
+            pending.append((nnn, nnn))
+            leaders.add(nnn)
+            targets = (pc + 2,)
+        elif instruction == OpCodes._00E0_RET:
+            targets = ()
+        elif instruction == OpCodes._BNNN_JP_V0_ADDR:
+            indirect_jumps.add(pc)
+            targets = ()
+        elif instruction in SKIPS:
+            targets = (pc + 2, pc + 4)
+        else:
+            if instruction == OpCodes._ANNN_LD_I_ADDR:
+                data_references.add(nnn)
+            flow[pc] = (pc + 2,)
+            pending.append((pc + 2, entry))
+            continue
+
+        # Everything but a plain instruction ends the block
+        flow[pc] = targets
+        for target in targets:
+            leaders.add(target)
+            pending.append((target, entry))
+
+    code = set(flow)
+
+    # Cut the reachable instructions into blocks at every leader
+    blocks = {}
+    successors = {}
+    for start in sorted(leaders):
+        if start not in code:
+            continue
+        pc = start
+        while True:
+            targets = flow[pc]
+            if targets != (pc + 2,) or pc + 2 in leaders or pc + 2 not in code:
+                break
+            pc += 2
+        blocks[start] = pc + 2
+        successors[start] = {target for target in targets if target in code}
+
+    # ROM bytes no instruction covers
+    covered = bytearray(end_of_rom)
+    for pc in code:
+        covered[pc] = covered[pc + 1] = 1
+    data = []
+    start = None
+    for address in range(Chip8.PROGRAM_START, end_of_rom + 1):
+        if address < end_of_rom and not covered[address]:
+            if start is None:
+                start = address
+        elif start is not None:
+            data.append((start, address))
+            start = None
+
+    return Analysis(hashlib.sha256(rom).hexdigest(), blocks, successors, calls, indirect_jumps,
+                    data_references, code, data)
+
+
+if __name__ == "__main__":
+    with open(sys.argv[1], "rb") as rom_file:
+        rom_bytes = rom_file.read()
+    rom_analysis = analyze(rom_bytes)
+    image = bytearray(Chip8.MEMORY_SIZE)
+    image[Chip8.PROGRAM_START:Chip8.PROGRAM_START + len(rom_bytes)] = rom_bytes
+
+    for block_start, block_end in sorted(rom_analysis.blocks.items()):
+        if block_start in rom_analysis.calls:
+            callees = ", ".join(f"{callee:#05x}" for callee in sorted(rom_analysis.calls[block_start]))
+            print(f"\nsub_{block_start:03x}:" + (f"  calls {callees}" if callees else ""))
+        print(f"  block {block_start:#05x}")
+        for address in range(block_start, block_end, 2):
+            word = (image[address] << 8) | image[address + 1]
+            print(f"    {address:#05x}  {word:04x}  {Decoder.mnemonic(word)}")
+        next_blocks = ", ".join(f"{target:#05x}" for target in sorted(rom_analysis.successors[block_start]))
+        if not next_blocks:
+            last = block_end - 2
+            if last in rom_analysis.indirect_jumps:
+                next_blocks = "indirect"
+            elif (image[last] << 8) | image[last + 1] == 0x00EE:
+                next_blocks = "return"
+            else:
+                next_blocks = "end"
+        print(f"    -> {next_blocks}")
+    for data_start, data_end in rom_analysis.data:
+        print(f"data {data_start:#05x}-{data_end - 1:#05x}  {data_end - data_start} bytes")
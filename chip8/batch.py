@@ -0,0 +1,397 @@
+import numpy
+
+import chip8.constants as constants
+import chip8.fonts as Fonts
+from chip8.chip8 import Chip8
+from chip8.decoder import Decoder, OpCodes
+from chip8.framebuffer import FrameBuffer
+from chip8.frontend import HeadlessFrontend
+
+
+class BatchChip8:
+    # N copies of one ROM stepped together in lockstep.
+    # Registers, stacks, timers, memory and framebuffers are NumPy arrays
+    # with one row per machine. Every step fetches the op code of each
+    # machine, groups the machines by instruction and runs each group with
+    # one vector operation, so machines whose PCs diverged still advance
+    # one instruction per step.
+    #
+    # CXKK uses a xorshift generator per machine seeded like Chip8, so
+    # machine i draws the same numbers as Chip8(seed=seeds[i]).
+    # A machine that hits an invalid instruction, a stack overflow or an out
+    # of range access is halted instead of raising, see `halted`.
+    #
+    # Usage:
+    #     batch = BatchChip8(count=1000)
+    #     batch.load_game("games/pong.ch8")
+    #     batch.run(cycles=10000)
+    #     batch.framebuffer(0)
+
+    def __init__(self, count, seeds=None, frontend=None):
+        self.count = count
+        machines = numpy.arange(count)
+        self.machines = machines
+
+        self.memory = numpy.zeros((count, Chip8.MEMORY_SIZE), dtype=numpy.uint8)
+        self.memory[:, 0:len(Fonts.fonts)] = Fonts.fonts
+
+        # Registers are kept as int32 and masked, so sums never wrap early
+        self.V = numpy.zeros((count, 16), dtype=numpy.int32)
+        self.I = numpy.zeros(count, dtype=numpy.int32)
+        self.PC = numpy.full(count, Chip8.PROGRAM_START, dtype=numpy.int32)
+        self.stack = numpy.zeros((count, 16), dtype=numpy.int32)
+        self.stack_pointer = numpy.full(count, -1, dtype=numpy.int32)
+        self.delay_timer = numpy.zeros(count, dtype=numpy.int32)
+        self.sound_timer = numpy.zeros(count, dtype=numpy.int32)
+        self.keys = numpy.zeros((count, 16), dtype=bool)
+
+        # 32 rows of 64 pixels per machine, packed like FrameBuffer.rows
+        self.rows = numpy.zeros((count, FrameBuffer.HEIGHT), dtype=numpy.uint64)
+
+        if seeds is None:
+            seeds = machines + 1
+        state = numpy.asarray(seeds, dtype=numpy.uint64) * 2654435761 % (1 << 32)
+        self.random_state = numpy.where(state == 0, 1, state).astype(numpy.uint32)
+
+        self.halted = numpy.zeros(count, dtype=bool)
+        self.running = machines
+
+        # poll_input(batch) is called once per frame to update batch.keys
+        self.frontend = HeadlessFrontend() if frontend is None else frontend
+
+        self.cycles_per_frame = max(1, constants.CLOCK_SPEED // constants.TIMER_SPEED)
+        self.frame_cycle = 0
+        self.cycle_count = 0
+        self.frame_count = 0
+
+    def load_game(self, game_path):
+        with open(game_path, "rb") as f:
+            rom = f.read()
+        self.load_rom(rom, name=game_path)
+
+    def load_rom(self, rom, name="ROM"):
+        max_size = Chip8.MEMORY_SIZE - Chip8.PROGRAM_START
+        if len(rom) > max_size:
+            raise ValueError(f"{name} is {len(rom)} bytes, the maximum is {max_size}")
+        self.memory[:, Chip8.PROGRAM_START:Chip8.PROGRAM_START + len(rom)] = numpy.frombuffer(rom, dtype=numpy.uint8)
+
+    def run(self, cycles):
+        # Same frame structure as Chip8.run, for every machine at once
+        while cycles > 0:
+            chunk = min(cycles, self.cycles_per_frame - self.frame_cycle)
+            for _ in range(chunk):
+                self.step()
+
+            cycles -= chunk
+            self.cycle_count += chunk
+            self.frame_cycle += chunk
+            if self.frame_cycle >= self.cycles_per_frame:
+                self.end_frame()
+
+    def run_frame(self):
+        self.run(self.cycles_per_frame - self.frame_cycle)
+
+    def end_frame(self):
+        self.frame_cycle = 0
+        self.frame_count += 1
+        self.delay_timer -= self.delay_timer > 0
+        self.sound_timer -= self.sound_timer > 0
+        self.frontend.poll_input(self)
+
+    def step(self):
+        running = self.running
+        if len(running) == 0:
+            return
+
+        pc = self.PC[running]
+        # The op code is fetched from pc and pc + 1
+        outside = pc >= Chip8.MEMORY_SIZE - 1
+        if outside.any():
+            self.halt(running[outside])
+            running = self.running
+            pc = self.PC[running]
+
+        memory = self.memory
+        op_code = (memory[running, pc].astype(numpy.int32) << 8) | memory[running, pc + 1]
+        kinds = self._kinds()[op_code]
+
+        # One vector operation per instruction present in this step
+        counts = numpy.bincount(kinds, minlength=len(self._kind_handlers))
+        for kind in numpy.flatnonzero(counts):
+            if counts[kind] == len(running):
+                select = slice(None)
+            else:
+                select = kinds == kind
+            codes = op_code[select]
+            handler = self._kind_handlers[kind]
+            handler(self, running[select], (codes >> 8) & 0xF, (codes >> 4) & 0xF, codes & 0xFF, codes & 0xFFF, codes & 0xF)
+
+        # Halted machines keep the PC of the instruction that stopped them
+        self.PC[self.running] += 2
+
+    def halt(self, machines):
+        self.halted[machines] = True
+        self.running = numpy.flatnonzero(~self.halted)
+
+    def framebuffer(self, index):
+        # A FrameBuffer copy of one machine's screen
+        framebuffer = FrameBuffer()
+        framebuffer.load_bytes(self.rows[index].astype(">u8").tobytes())
+        framebuffer.dirty_rows.clear()
+        return framebuffer
+
+    # Instruction handlers, each runs one instruction on the machines `m`,
+    # the operands are arrays with one value per machine
+
+    def _op_invalid(self, m, x, y, kk, nnn, n):
+        self.halt(m)
+
+    def _op_00e0_cls(self, m, x, y, kk, nnn, n):
+        self.rows[m] = 0
+
+    def _op_00ee_ret(self, m, x, y, kk, nnn, n):
+        sp = self.stack_pointer[m]
+        underflow = sp < 0
+        if underflow.any():
+            self.halt(m[underflow])
+            m, sp = m[~underflow], sp[~underflow]
+        self.PC[m] = self.stack[m, sp]
+        self.stack_pointer[m] = sp - 1
+
+    def _op_0nnn_sys(self, m, x, y, kk, nnn, n):
+        pass
+
+    def _op_1nnn_jp(self, m, x, y, kk, nnn, n):
+        self.PC[m] = nnn - 2
+
+    def _op_2nnn_call(self, m, x, y, kk, nnn, n):
+        sp = self.stack_pointer[m] + 1
+        overflow = sp > 15
+        if overflow.any():
+            self.halt(m[overflow])
+            m, sp, nnn = m[~overflow], sp[~overflow], nnn[~overflow]
+        self.stack_pointer[m] = sp
+        self.stack[m, sp] = self.PC[m]
+        self.PC[m] = nnn - 2
+
+    def _op_3xkk_se(self, m, x, y, kk, nnn, n):
+        self.PC[m] += (self.V[m, x] == kk) * 2
+
+    def _op_4xkk_sne(self, m, x, y, kk, nnn, n):
+        self.PC[m] += (self.V[m, x] != kk) * 2
+
+    def _op_5xy0_se(self, m, x, y, kk, nnn, n):
+        self.PC[m] += (self.V[m, x] == self.V[m, y]) * 2
+
+    def _op_6xkk_ld(self, m, x, y, kk, nnn, n):
+        self.V[m, x] = kk
+
+    def _op_7xkk_add(self, m, x, y, kk, nnn, n):
+        self.V[m, x] = (self.V[m, x] + kk) & 0xFF
+
+    def _op_8xy0_ld(self, m, x, y, kk, nnn, n):
+        self.V[m, x] = self.V[m, y]
+
+    def _op_8xy1_or(self, m, x, y, kk, nnn, n):
+        self.V[m, x] |= self.V[m, y]
+
+    def _op_8xy2_and(self, m, x, y, kk, nnn, n):
+        self.V[m, x] &= self.V[m, y]
+
+    def _op_8xy3_xor(self, m, x, y, kk, nnn, n):
+        self.V[m, x] ^= self.V[m, y]
+
+    # The writes below keep the order of the Chip8 handlers,
+    # so the same register wins when x is F
+
+    def _op_8xy4_add(self, m, x, y, kk, nnn, n):
+        total = self.V[m, x] + self.V[m, y]
+        self.V[m, x] = total & 0xFF
+        self.V[m, 0xF] = total > 0xFF
+
+    def _op_8xy5_sub(self, m, x, y, kk, nnn, n):
+        vx = self.V[m, x]
+        vy = self.V[m, y]
+        self.V[m, 0xF] = vx >= vy
+        self.V[m, x] = numpy.abs(vx - vy) & 0xFF
+
+    def _op_8xy6_shr(self, m, x, y, kk, nnn, n):
+        vx = self.V[m, x]
+        self.V[m, x] = vx >> 1
+        self.V[m, 0xF] = vx & 1
+
+    def _op_8xy7_subn(self, m, x, y, kk, nnn, n):
+        vx = self.V[m, x]
+        vy = self.V[m, y]
+        self.V[m, 0xF] = vy >= vx
+        self.V[m, x] = numpy.abs(vy - vx) & 0xFF
+
+    def _op_8xye_shl(self, m, x, y, kk, nnn, n):
+        # Shifts Vx as it is after the VF write, like Chip8
+        self.V[m, 0xF] = self.V[m, x] >> 7
+        self.V[m, x] = (self.V[m, x] << 1) & 0xFF
+
+    def _op_9xy0_sne(self, m, x, y, kk, nnn, n):
+        self.PC[m] += (self.V[m, x] != self.V[m, y]) * 2
+
+    def _op_annn_ld_i(self, m, x, y, kk, nnn, n):
+        self.I[m] = nnn
+
+    def _op_bnnn_jp_v0(self, m, x, y, kk, nnn, n):
+        self.PC[m] = nnn + self.V[m, 0] - 2
+
+    def _op_cxkk_rnd(self, m, x, y, kk, nnn, n):
+        # xorshift32, one state per machine
+        state = self.random_state[m]
+        state ^= state << numpy.uint32(13)
+        state ^= state >> numpy.uint32(17)
+        state ^= state << numpy.uint32(5)
+        self.random_state[m] = state
+        self.V[m, x] = (state & 0xFF).astype(numpy.int32) & kk
+
+    def _op_dxyn_drw(self, m, x, y, kk, nnn, n):
+        # Sprite row j of every machine is drawn together,
+        # the rows of one sprite never land on the same screen row
+        rows = self.rows
+        memory = self.memory
+        shift = (self.V[m, x] % FrameBuffer.WIDTH).astype(numpy.uint64)
+        unshifted = shift == 0
+        back_shift = numpy.where(unshifted, 0, FrameBuffer.WIDTH - shift).astype(numpy.uint64)
+        top = self.V[m, y]
+        start = self.I[m]
+        collision = numpy.zeros(len(m), dtype=bool)
+        for j in range(int(n.max())):
+            # Like the slice in Chip8, a sprite stops at the end of memory
+            drawn = (j < n) & (start + j < Chip8.MEMORY_SIZE)
+            if not drawn.any():
+                break
+            address = numpy.where(drawn, start + j, 0)
+            bits = memory[m, address].astype(numpy.uint64) * drawn << numpy.uint64(FrameBuffer.WIDTH - 8)
+            bits = numpy.where(unshifted, bits, (bits >> shift) | (bits << back_shift))
+            location_y = (top + j) % FrameBuffer.HEIGHT
+            row = rows[m, location_y]
+            collision |= (row & bits) != 0
+            rows[m, location_y] = row ^ bits
+        self.V[m, 0xF] = collision
+
+    def _key_states(self, m, x):
+        key = self.V[m, x]
+        invalid = key > 15
+        if invalid.any():
+            self.halt(m[invalid])
+            key = key & 0xF
+        return self.keys[m, key], invalid
+
+    def _op_ex9e_skp(self, m, x, y, kk, nnn, n):
+        pressed, invalid = self._key_states(m, x)
+        self.PC[m] += (pressed & ~invalid) * 2
+
+    def _op_exa1_sknp(self, m, x, y, kk, nnn, n):
+        pressed, invalid = self._key_states(m, x)
+        self.PC[m] += (~pressed & ~invalid) * 2
+
+    def _op_fx07_ld_vx_dt(self, m, x, y, kk, nnn, n):
+        self.V[m, x] = self.delay_timer[m]
+
+    def _op_fx0a_ld_vx_k(self, m, x, y, kk, nnn, n):
+        # Like Chip8, the highest key down wins, with no key down the
+        # instruction runs again on the next step
+        keys = self.keys[m]
+        down = keys.any(axis=1)
+        highest = 15 - numpy.argmax(keys[:, ::-1], axis=1)
+        self.V[m[down], x[down]] = highest[down]
+        self.PC[m[~down]] -= 2
+
+    def _op_fx15_ld_dt_vx(self, m, x, y, kk, nnn, n):
+        self.delay_timer[m] = self.V[m, x]
+
+    def _op_fx18_ld_st_vx(self, m, x, y, kk, nnn, n):
+        self.sound_timer[m] = self.V[m, x]
+
+    def _op_fx1e_add_i_vx(self, m, x, y, kk, nnn, n):
+        self.I[m] = (self.I[m] + self.V[m, x]) & 0xFFFF
+
+    def _op_fx29_ld_f_vx(self, m, x, y, kk, nnn, n):
+        self.I[m] = self.V[m, x] * 5
+
+    def _checked(self, m, x, length):
+        # Halt the machines whose transfer would run past the end of memory
+        outside = self.I[m] + length > Chip8.MEMORY_SIZE
+        if outside.any():
+            self.halt(m[outside])
+            return m[~outside], x[~outside]
+        return m, x
+
+    def _op_fx33_ld_b_vx(self, m, x, y, kk, nnn, n):
+        m, x = self._checked(m, x, 3)
+        value = self.V[m, x]
+        start = self.I[m]
+        self.memory[m, start] = value // 100
+        self.memory[m, start + 1] = value // 10 % 10
+        self.memory[m, start + 2] = value % 10
+
+    def _op_fx55_ld_i_vx(self, m, x, y, kk, nnn, n):
+        m, x = self._checked(m, x, x + 1)
+        start = self.I[m]
+        for register in range(int(x.max(initial=-1)) + 1):
+            stored = register <= x
+            self.memory[m[stored], start[stored] + register] = self.V[m[stored], register]
+
+    def _op_fx65_ld_vx_i(self, m, x, y, kk, nnn, n):
+        m, x = self._checked(m, x, x + 1)
+        start = self.I[m]
+        for register in range(int(x.max(initial=-1)) + 1):
+            loaded = register <= x
+            self.V[m[loaded], register] = self.memory[m[loaded], start[loaded] + register]
+
+    _handlers = {
+        OpCodes._NO_OPCODE: _op_invalid,
+        OpCodes._00E0_CLS: _op_00e0_cls,
+        OpCodes._00E0_RET: _op_00ee_ret,
+        OpCodes._0NNN_SYS_ADDR: _op_0nnn_sys,
+        OpCodes._1NNN_JP_ADDR: _op_1nnn_jp,
+        OpCodes._2NNN_CALL_ADDR: _op_2nnn_call,
+        OpCodes._3XKK_SE_VX_BYTE: _op_3xkk_se,
+        OpCodes._4XKK_SNE_VX_BYTE: _op_4xkk_sne,
+        OpCodes._5XY0_SE_VX_VY: _op_5xy0_se,
+        OpCodes._6XKK_LD_VX_BYTE: _op_6xkk_ld,
+        OpCodes._7XKK_ADD_VX_BYTE: _op_7xkk_add,
+        OpCodes._8XY0_LD_VX_VY: _op_8xy0_ld,
+        OpCodes._8XY1_OR_VX_VY: _op_8xy1_or,
+        OpCodes._8XY2_AND_VX_VY: _op_8xy2_and,
+        OpCodes._8XY3_XOR_VX_VY: _op_8xy3_xor,
+        OpCodes._8XY4_ADD_VX_VY: _op_8xy4_add,
+        OpCodes._8xy5_SUB_VX_VY: _op_8xy5_sub,
+        OpCodes._8XY6_SHR_VX: _op_8xy6_shr,
+        OpCodes._8XY7_SUBN_VX_VY: _op_8xy7_subn,
+        OpCodes._820E_SHL_VX: _op_8xye_shl,
+        OpCodes._9XY0_SNE_VX_VY: _op_9xy0_sne,
+        OpCodes._ANNN_LD_I_ADDR: _op_annn_ld_i,
+        OpCodes._BNNN_JP_V0_ADDR: _op_bnnn_jp_v0,
+        OpCodes._CKKK_RND_VX_BYTE: _op_cxkk_rnd,
+        OpCodes._DXYN_DRW_VX_VY: _op_dxyn_drw,
+        OpCodes._E09E_SKP_VX: _op_ex9e_skp,
+        OpCodes._EXA1_SKPN_VX: _op_exa1_sknp,
+        OpCodes._FX07_LD_VX_DT: _op_fx07_ld_vx_dt,
+        OpCodes._FX0A_LD_VX_K: _op_fx0a_ld_vx_k,
+        OpCodes._FX15_LD_DT_VX: _op_fx15_ld_dt_vx,
+        OpCodes._FX18_LD_ST_VX: _op_fx18_ld_st_vx,
+        OpCodes._FX1E_ADD_I_VX: _op_fx1e_add_i_vx,
+        OpCodes._FX29_LD_F_VX: _op_fx29_ld_f_vx,
+        OpCodes._FX33_LD_B_VX: _op_fx33_ld_b_vx,
+        OpCodes._FX55_LD_I_VX: _op_fx55_ld_i_vx,
+        OpCodes._FX65_LD_VX_I: _op_fx65_ld_vx_i,
+    }
+
+    # Handler of each instruction kind, and op code -> kind for all 65536
+    # op codes, built on first use
+    _kind_handlers = list(_handlers.values())
+    _kind_table = None
+
+    @classmethod
+    def _kinds(cls):
+        if cls._kind_table is None:
+            kinds = {instruction: index for index, instruction in enumerate(cls._handlers)}
+            cls._kind_table = numpy.array([kinds[Decoder.decode(op_code)] for op_code in range(0x10000)],
+                                          dtype=numpy.intp)
+        return cls._kind_table
@@ -1,18 +1,50 @@
-import pygame
-import random
+import os
+import struct
 
 from chip8.decoder import Decoder, OpCodes
-from chip8.graphics import Screen
+from chip8.framebuffer import FrameBuffer
+from chip8.frontend import HeadlessFrontend
 
 import chip8.constants as constants
 import chip8.fonts as Fonts
-import chip8.keys as Keys
+
+
+class Idle(Exception):
+    # Raised by an instruction that completed an idle loop: the machine
+    # would spin through the same `length` instructions until the frame
+    # ends, without changing anything but `register` (set to the delay timer)
+    def __init__(self, length, register=None):
+        super().__init__(length, register)
+        self.length = length
+        self.register = register
+
+
+class InvalidOpcode(ValueError):
+    # Raised by an op code that is not a CHIP-8 instruction
+    def __init__(self, op_code, pc):
+        super().__init__(f"Invalid op code {op_code:#06x} at {pc:#05x}")
+        self.op_code = op_code
+        self.pc = pc
 
 
 class Chip8:
-    def __init__(self):
+    MEMORY_SIZE = 4096
+    PROGRAM_START = 0x200
+
+    # Save state: magic, version, PC, I, stack pointer, delay timer,
+    # sound timer, frame cycle, cycle count, frame count, keys as a bit mask,
+    # random state, V0 .. VF and the stack, followed by the memory and the
+    # screen rows
+    STATE_MAGIC = b"C8ST"
+    STATE_VERSION = 2
+    STATE_HEADER = struct.Struct("<4sBHHbBBHQQHI16B16H")
+
+    # FX33 and FX55 masked with 0xF0FF, the instructions that write memory
+    WRITES_MEMORY = (0xF033, 0xF055)
+
+    def __init__(self, frontend=None, seed=None):
         # 4096 BYTES
-        self.memory = [0] * 4096
+        self.memory = bytearray(self.MEMORY_SIZE)
 
         # 16 8-bit registers
         self.V = [0] * 16
@@ -22,9 +54,6 @@ class Chip8:
         self.I = 0
         self.PC = 0x200
 
-        # 64 x 32 pixels
-        self.pixels = [64 * 32] * 0
-
         # 2 8-bit timers
         self.delay_timer = 0
         self.sound_timer = 0
@@ -41,21 +70,59 @@ class Chip8:
         self.screen = None
         self.keys = None
 
+        # Display, input and audio backend, pygame window when not given
+        self.frontend = frontend
+
+        # Optional execution engine used by run() instead of the
+        # interpreter, e.g. recompiler.Recompiler
+        self.engine = None
+
+        # Optional trace.Tracer recording every executed instruction
+        self.tracer = None
+
+        # Optional profiler.Profiler counting every executed instruction
+        self.profiler = None
+
+        # debugger.Debugger, set only while a breakpoint or watchpoint is armed
+        self.debugger = None
+
+        # The timers tick once per frame, every cycles_per_frame instructions
+        self.cycles_per_frame = max(1, constants.CLOCK_SPEED // constants.TIMER_SPEED)
+        self.frame_cycle = 0
+        self.cycle_count = 0
+        self.frame_count = 0
+
+        # Called with the machine at the end of every frame, e.g. rewind.Rewind
+        self.frame_hooks = []
+
+        # Instructions not executed because the machine was idle
+        self.idle_cycles = 0
+
+        # CXKK draws from a xorshift generator owned by the machine,
+        # so the same seed and input always replay the same game
+        self.seed = None
+        self.random_state = 1
+        self.seed_random(int.from_bytes(os.urandom(4), "little") if seed is None else seed)
+
     def initialize(self):
         # Initialize decoder
         self.decoder = Decoder()
 
         # Initialize Screen
-        self.screen = Screen()
-        self.screen.initialize()
+        self.screen = FrameBuffer()
+
+        if self.frontend is None:
+            # Imported here so headless runs never load pygame
+            from chip8.graphics import PygameFrontend
+            self.frontend = PygameFrontend()
+        self.frontend.initialize()
 
         self.load_fonts()
         self.setup_keys()
 
     def load_fonts(self):
         # Fonts loaded from 0 to 80
-        for i in range(len(Fonts.fonts)):
-            self.memory[i] = Fonts.fonts[i]
+        self.memory[0:len(Fonts.fonts)] = bytes(Fonts.fonts)
 
     def setup_keys(self):
         self.keys = []
@@ -63,44 +130,261 @@ class Chip8:
             self.keys.append(False)
 
     def load_game(self, game_path):
-        buffer = []
-        chunk_size = 1
         with open(game_path, "rb") as f:
-            bytes_read = f.read(chunk_size)
-            buffer.append(bytes_read)
-            while bytes_read:
-                bytes_read = f.read(chunk_size)
-                if bytes_read is not None and bytes_read != b'':
-                    buffer.append(bytes_read)
-
-        # Save buffer to memory
-        for i in range(0, len(buffer)):
-            hex_of_buffer = buffer[i].hex()
-            int_of_opcode = int(hex_of_buffer, base=16)
-            self.memory[512 + i] = int_of_opcode
+            rom = f.read()
+        self.load_rom(rom, name=game_path)
+
+    def load_rom(self, rom, name="ROM"):
+        # Copy a whole ROM image into memory at 0x200
+        max_size = self.MEMORY_SIZE - self.PROGRAM_START
+        if len(rom) > max_size:
+            raise ValueError(f"{name} is {len(rom)} bytes, the maximum is {max_size}")
+        self.memory[self.PROGRAM_START:self.PROGRAM_START + len(rom)] = rom
+        self.memory_replaced()
 
     def loop(self):
-        clock = pygame.time.Clock()
-        clock_speed = constants.CLOCK_SPEED
-        while True:
-            # -> Keys
-            # -> Fetch OpCode
-            # -> Decode OpCode and get Instruction
-            # -> Execute Instruction
-            # -> Update screen
-            # -> Update program counter
-            # -> Update timers
-
-            clock.tick(clock_speed)
-            self.handle_keys()
-            self.fetch_opcode()
-            self.decode_opcode()
+        # Imported here so headless runs never load the scheduler
+        from chip8.scheduler import Scheduler, ThreadedScheduler
+        if constants.THREADED:
+            ThreadedScheduler(self).run()
+        else:
+            Scheduler(self).run()
+
+    def run(self, cycles):
+        # Execute a fixed number of instructions as fast as possible,
+        # without pacing or presenting frames.
+        # Every cycles_per_frame instructions a frame ends,
+        # the timers tick and the input is polled.
+        memory = self.memory
+        while cycles > 0:
+            chunk = min(cycles, self.cycles_per_frame - self.frame_cycle)
+            pc = self.PC
+            if (chunk == self.cycles_per_frame and memory[pc] == 0x10 | pc >> 8 and memory[pc + 1] == pc & 0xFF
+                    and self.frontend.skippable and not self.frame_hooks and self.debugger is None):
+                # Halted in a jump to itself, only the timers move
+                frames = cycles // self.cycles_per_frame
+                self.fast_forward(frames)
+                cycles -= frames * self.cycles_per_frame
+                continue
+
+            if self.debugger is not None:
+                self.debugger.execute(chunk)
+            elif self.tracer is not None:
+                self.execute_traced(chunk)
+            elif self.profiler is not None:
+                self.profiler.execute(chunk)
+            elif self.engine is not None:
+                self.engine.execute(chunk)
+            else:
+                self.execute(chunk)
+
+            cycles -= chunk
+            self.cycle_count += chunk
+            self.frame_cycle += chunk
+            if self.frame_cycle >= self.cycles_per_frame:
+                self.end_frame()
+
+    def fast_forward(self, frames):
+        # End `frames` whole frames without executing anything
+        cycles = frames * self.cycles_per_frame
+        self.cycle_count += cycles
+        self.idle_cycles += cycles
+        self.frame_count += frames
+        self.delay_timer = max(0, self.delay_timer - frames)
+        if self.sound_timer:
+            beep = frames >= self.sound_timer
+            self.sound_timer = max(0, self.sound_timer - frames)
+            if beep:
+                self.frontend.play_beep()
+        self.handle_keys()
+
+    def run_frame(self):
+        # Execute the rest of the current frame
+        self.run(self.cycles_per_frame - self.frame_cycle)
+
+    def end_frame(self):
+        self.frame_cycle = 0
+        self.frame_count += 1
+        self.update_timers()
+        self.handle_keys()
+        for hook in self.frame_hooks:
+            hook(self)
+
+    def execute(self, cycles):
+        # The interpreter loop
+        memory = self.memory
+        dispatch = self._dispatch
+        executed = 0
+        try:
+            for executed in range(cycles):
+                pc = self.PC
+                op_code = (memory[pc] << 8) | memory[pc + 1]
+                entry = dispatch.get(op_code)
+                if entry is None:
+                    entry = self.predecode(op_code)
+                handler, x, y, kk, nnn, n = entry
+                handler(self, x, y, kk, nnn, n)
+                self.PC += 2
+        except Idle as idle:
+            rest = self.skip_idle(idle, cycles - executed - 1)
+            if rest:
+                self.execute(rest)
+
+    def execute_traced(self, cycles):
+        # The interpreter loop, recording each instruction before it runs
+        memory = self.memory
+        dispatch = self._dispatch
+        record = self.tracer.record
+        executed = 0
+        try:
+            for executed in range(cycles):
+                pc = self.PC
+                op_code = (memory[pc] << 8) | memory[pc + 1]
+                record(pc, op_code, self.I, self.V)
+                entry = dispatch.get(op_code)
+                if entry is None:
+                    entry = self.predecode(op_code)
+                handler, x, y, kk, nnn, n = entry
+                handler(self, x, y, kk, nnn, n)
+                self.PC += 2
+                if op_code & 0xF0FF in self.WRITES_MEMORY:
+                    self.memory_written(op_code)
+        except Idle as idle:
+            rest = self.skip_idle(idle, cycles - executed - 1)
+            if rest:
+                self.execute_traced(rest)
+
+    def skip_idle(self, idle, remaining):
+        # Finish the instruction that raised `idle` and skip the whole idle
+        # loop iterations that fit in the `remaining` cycles of the chunk.
+        # Returns the cycles left to execute, fewer than one iteration, so
+        # the machine ends the chunk in the same state as if it had spun.
+        self.PC += 2
+        skipped = remaining - remaining % idle.length
+        if skipped and idle.register is not None:
+            self.V[idle.register] = self.delay_timer
+        self.idle_cycles += skipped
+        return remaining - skipped
+
+    def delay_wait(self, start):
+        # Register of a "FX07, 3XKK or 4XKK, jump back to FX07" loop at
+        # start that keeps waiting with the current delay timer, or None
+        memory = self.memory
+        if memory[start] & 0xF0 != 0xF0 or memory[start + 1] != 0x07:
+            return None
+        x = memory[start] & 0x0F
+        kind = memory[start + 2]
+        kk = memory[start + 3]
+        if kind == 0x30 | x and self.delay_timer != kk:
+            return x
+        if kind == 0x40 | x and self.delay_timer == kk:
+            return x
+        return None
+
+    def seed_random(self, seed):
+        # Same seeding as batch.BatchChip8, the state must not be 0
+        self.seed = seed
+        self.random_state = (seed * 2654435761) % (1 << 32) or 1
+
+    def random_byte(self):
+        # xorshift32
+        state = self.random_state
+        state ^= (state << 13) & 0xFFFFFFFF
+        state ^= state >> 17
+        state ^= (state << 5) & 0xFFFFFFFF
+        self.random_state = state
+        return state & 0xFF
+
+    def save_state(self):
+        # The whole machine as a compact binary blob, about 4.4 KB
+        keys = 0
+        for i in range(16):
+            if self.keys[i]:
+                keys |= 1 << i
+        header = self.STATE_HEADER.pack(
+            self.STATE_MAGIC, self.STATE_VERSION, self.PC, self.I, self.stack_pointer,
+            self.delay_timer, self.sound_timer, self.frame_cycle, self.cycle_count, self.frame_count,
+            keys, self.random_state, *self.V, *self.stack)
+        return header + self.memory + self.screen.to_bytes()
+
+    def load_state(self, state):
+        # Restore a blob from save_state, on an initialized machine
+        header_size = self.STATE_HEADER.size
+        if len(state) != header_size + self.MEMORY_SIZE + FrameBuffer.HEIGHT * 8:
+            raise ValueError(f"Save state is {len(state)} bytes, not a valid state")
+        fields = self.STATE_HEADER.unpack_from(state)
+        magic, version = fields[:2]
+        if magic != self.STATE_MAGIC or version != self.STATE_VERSION:
+            raise ValueError(f"Unsupported save state {magic!r} version {version}")
+
+        (self.PC, self.I, self.stack_pointer, self.delay_timer, self.sound_timer,
+         self.frame_cycle, self.cycle_count, self.frame_count, keys, self.random_state) = fields[2:12]
+        self.V = list(fields[12:28])
+        self.stack = list(fields[28:44])
+        self.keys = [bool(keys >> i & 1) for i in range(16)]
+        self.memory[:] = state[header_size:header_size + self.MEMORY_SIZE]
+        self.screen.load_bytes(state[header_size + self.MEMORY_SIZE:])
+        self.memory_replaced()
+
+    def snapshot(self):
+        # In-memory copy of the machine state, cheaper than save_state
+        return (bytes(self.memory), tuple(self.V), self.I, self.PC, tuple(self.stack), self.stack_pointer,
+                self.delay_timer, self.sound_timer, tuple(self.keys), tuple(self.screen.rows),
+                self.frame_cycle, self.cycle_count, self.frame_count, self.random_state)
+
+    def restore(self, snapshot):
+        (memory, V, self.I, self.PC, stack, self.stack_pointer, self.delay_timer, self.sound_timer,
+         keys, rows, self.frame_cycle, self.cycle_count, self.frame_count, self.random_state) = snapshot
+        self.memory[:] = memory
+        self.V = list(V)
+        self.stack = list(stack)
+        self.keys = list(keys)
+        self.screen.rows = list(rows)
+        self.screen.dirty_rows.update(range(FrameBuffer.HEIGHT))
+        self.memory_replaced()
+
+    def fork(self, frontend=None):
+        # A new machine continuing from this one's current state, e.g. to
+        # explore several inputs from the same point of a game.
+        # It runs headless unless a frontend is given, with the interpreter.
+        if frontend is None:
+            frontend = HeadlessFrontend()
+        child = type(self)(frontend)
+        child.initialize()
+        child.cycles_per_frame = self.cycles_per_frame
+        child.restore(self.snapshot())
+        return child
+
+    def memory_written(self, op_code):
+        # FX33 or FX55 just wrote memory at I, code an engine translated
+        # from there is stale. Only needed by loops running instead of the
+        # engine, the engines watch their own writes.
+        if self.engine is not None:
+            length = 3 if op_code & 0xFF == 0x33 else ((op_code >> 8) & 0x0F) + 1
+            self.engine.invalidate(self.I, self.I + length)
+
+    def memory_replaced(self):
+        # Code translated from the old memory is stale
+        if self.engine is not None:
+            self.engine.invalidate_all()
+
+    def step(self):
+        # -> Fetch OpCode
+        # -> Decode OpCode and get Instruction
+        # -> Execute Instruction
+        # -> Update program counter
+
+        self.fetch_opcode()
+        self.decode_opcode()
+        try:
             self.execute_instruction()
-            self.screen.update_screen()
-            self.increment_counter()
-            self.update_timers()
+        except Idle:
+            # A single step has no idle cycles to skip
+            pass
+        self.increment_counter()
 
     def update_timers(self):
+        # Called once per frame, 60 times per second
         if self.delay_timer >= 1:
             self.delay_timer = self.delay_timer - 1
 
@@ -108,27 +392,10 @@ class Chip8:
         if self.sound_timer >= 1:
             self.sound_timer = self.sound_timer - 1
             if self.sound_timer == 0:
-                self.screen.play_beep_sound()
+                self.frontend.play_beep()
 
     def handle_keys(self):
-        events = pygame.event.get()
-        for event in events:
-            if event.type == pygame.QUIT:
-                exit()
-            elif event.type == pygame.KEYDOWN:
-                pressed_key = event.key
-                if pressed_key in Keys.key_dict:
-                    mapped_key = Keys.key_dict[pressed_key]
-                    msg = fr"Yuo Pressed : {chr(pressed_key)}"
-                    self.debug_print(msg)
-                    self.keys[mapped_key] = True
-            elif event.type == pygame.KEYUP:
-                released_key = event.key
-                if released_key in Keys.key_dict:
-                    mapped_key = Keys.key_dict[released_key]
-                    msg = fr"You Released : {chr(released_key)}"
-                    self.debug_print(msg)
-                    self.keys[mapped_key] = False
+        self.frontend.poll_input(self)
 
     def fetch_opcode(self):
         # Opcode is 2 Byte long
@@ -141,10 +408,17 @@ class Chip8:
         op_code = self.op_code
         decoded_instruction = self.decoder.decode(op_code)
         if decoded_instruction == OpCodes._NO_OPCODE:
-            print("Unexpected Error Happened")
-            exit()
+            raise InvalidOpcode(op_code, self.PC)
         self.decoded_instruction = decoded_instruction
 
+    def predecode(self, op_code):
+        # Decode an op code once into its handler and operands,
+        # every later fetch of the same op code is a single dict lookup
+        instruction = Decoder.decode(op_code)
+        entry = (self._handlers[instruction],) + self.get_arguments(op_code)
+        self._dispatch[op_code] = entry
+        return entry
+
     def get_arguments(self, op_code):
         # _xy_
         # __kk
@@ -164,307 +438,251 @@ class Chip8:
     def execute_instruction(self):
         op_code = self.op_code
         instruction = self.decoded_instruction
-        x, y, kk, nnn, n = self.get_arguments(op_code)
-        op_code_hex = self.format_to_hex(op_code)[2:]
-
-        if instruction == OpCodes._00E0_CLS:
-            msg = "00e0 : Clearing Screen"
-            self.debug_print(msg)
-
-            self.screen.clear_screen()
-
-        elif instruction == OpCodes._00E0_RET:
-            # Return from subroutine
-            msg = fr"{op_code_hex} : Return From Subroutine"
-            self.debug_print(msg)
-
-            self.PC = self.stack[self.stack_pointer]
-            self.stack_pointer = self.stack_pointer - 1
-
-        elif instruction == OpCodes._1NNN_JP_ADDR:
-            # sets the program counter to nnn.
-            msg = fr"{op_code_hex} : Set PC to nnn"
-            self.debug_print(msg)
-
-            self.PC = nnn - 2
-
-        elif instruction == OpCodes._2NNN_CALL_ADDR:
-            # Call Subroutine nnn
-            msg = fr"{op_code_hex} : Call subroutine at nnn"
-            self.debug_print(msg)
-
-            self.stack_pointer = self.stack_pointer + 1
-            self.stack[self.stack_pointer] = self.PC
-            self.PC = nnn - 2
-        elif instruction == OpCodes._3XKK_SE_VX_BYTE:
-            # Skip next instruction if V[x] == KK
-            msg = fr"{op_code_hex} : Skip next instruction if V[x] == KK"
-            self.debug_print(msg)
-
-            if self.V[x] == kk:
-                self.increment_counter()
-
-        elif instruction == OpCodes._4XKK_SNE_VX_BYTE:
-            # Skip next instruction if V[x] != KK
-            msg = fr"{op_code_hex} : Skip next instruction if Vx != kk"
-            self.debug_print(msg)
-
-            if self.V[x] != kk:
-                self.increment_counter()
-
-        elif instruction == OpCodes._5XY0_SE_VX_VY:
-            # Skip next instruction if v[x] == v[y]
-            msg = fr"{op_code_hex} : Skip next instruction if Vx == Vy"
-            self.debug_print(msg)
-
-            if self.V[x] == self.V[y]:
-                self.increment_counter()
-
-        elif instruction == OpCodes._6XKK_LD_VX_BYTE:
-            # Put value kk in V[x]
-            msg = fr"{op_code_hex} : Put value kk in Vx"
-            self.debug_print(msg)
-
-            self.V[x] = kk
-
-        elif instruction == OpCodes._7XKK_ADD_VX_BYTE:
-            # Vx = Vx + kk
-            msg = fr"{op_code_hex} : Set Vx = Vx + kk"
-            self.debug_print(msg)
-
-            ans, carry = self.add(self.V[x], kk)
-            self.V[x] = ans
-
-        elif instruction == OpCodes._8XY0_LD_VX_VY:
-            # Set Vx = Vy.
-            msg = fr"{op_code_hex} : Set Vx = Vy"
-            self.debug_print(msg)
-
-            self.V[x] = self.V[y]
-
-        elif instruction == OpCodes._8XY1_OR_VX_VY:
-            # Set Vx = Vx OR Vy
-            msg = fr"{op_code_hex} : Set Vx = Vx OR Vy"
-            self.debug_print(msg)
-
-            self.V[x] = self.V[x] | self.V[y]
-
-        elif instruction == OpCodes._8XY2_AND_VX_VY:
-            # Set Vx = Vx AND Vy
-            msg = fr"{op_code_hex} : Set Vx = Vx AND Vy"
-            self.debug_print(msg)
-
-            self.V[x] = self.V[x] & self.V[y]
-
-        elif instruction == OpCodes._8XY3_XOR_VX_VY:
-            # Set Vx = Vx XOR Vy
-            msg = fr"{op_code_hex} : Set Vx = Vx XOR Vy"
-            self.debug_print(msg)
-
-            self.V[x] = self.V[x] ^ self.V[y]
-
-        elif instruction == OpCodes._8XY4_ADD_VX_VY:
-            # Set Vx = Vx + Vy, set VF = carry.
-            msg = fr"{op_code_hex} : Set Vx = Vx + Vy, set VF = carry"
-            self.debug_print(msg)
-
-            ans, carry = self.add(self.V[x], self.V[y])
-            self.V[x] = ans
-            self.V[0xF] = 1 if carry else 0
-
-        elif instruction == OpCodes._8xy5_SUB_VX_VY:
-            # Set Vx = Vx - Vy, set VF = NOT borrow
-            msg = fr"{op_code_hex} : Set Vx = Vx - Vy, set VF = NOT borrow"
-            self.debug_print(msg)
-
-            ans, carry = self.sub(self.V[x], self.V[y])
-            self.V[0xF] = 0 if carry else 1
-            self.V[x] = ans
-
-        elif instruction == OpCodes._8XY6_SHR_VX:
-            # Set Vx = Vx SHR 1, set VF = Overflow
-            msg = fr"{op_code_hex} : Set Vx = Vx SHR 1, set VF = Overflow"
-            self.debug_print(msg)
-
-            lower_digit_is_one = ((self.V[x] & 1) == 1)
-            ans = self.V[x] >> 1
-
-            self.V[x] = ans
-            self.V[0xF] = lower_digit_is_one
-
-        elif instruction == OpCodes._8XY7_SUBN_VX_VY:
-            # Set Vx = Vy - Vx, set VF = NOT borrow
-            msg = fr"{op_code_hex} : Set Vx = Vy - Vx, set VF = NOT borrow"
-            self.debug_print(msg)
-
-            ans, carry = self.sub(self.V[y], self.V[x])
-            self.V[0xF] = 0 if carry else 1
-            self.V[x] = ans
-
-        elif instruction == OpCodes._820E_SHL_VX:
-            # Set Vx = Vx SHL 1
-            # If the most-significant bit of Vx is 1,
-            # then VF is set to 1, otherwise to 0
-            msg = fr"{op_code_hex} : Set Vx = Vx SHL 1"
-            self.debug_print(msg)
-
-            msb_is_one = ((self.V[x] & 0x80) == 0x80)
-            self.V[0xF] = 1 if msb_is_one else 0
-            self.V[x] = ((self.V[x] << 1) & 0xFF)
-
-        elif instruction == OpCodes._9XY0_SNE_VX_VY:
-            # Skip next instruction if Vx != Vy
-            msg = fr"{op_code_hex} : Skip next instruction if Vx != Vy"
-            self.debug_print(msg)
-
-            if self.V[x] != self.V[y]:
-                self.increment_counter()
-
-        elif instruction == OpCodes._ANNN_LD_I_ADDR:
-            # Set IndexRegister to nnn
-            msg = fr"{op_code_hex} : Set IndexRegister to nnn"
-            self.debug_print(msg)
-
-            self.I = nnn
-
-        elif instruction == OpCodes._BNNN_JP_V0_ADDR:
-            # Set PC to nnn + V[0]
-            msg = fr"{op_code_hex} : Set PC to nnn + V[0]"
-            self.debug_print(msg)
-
-            self.PC = nnn + self.V[0] - 2
-
-        elif instruction == OpCodes._CKKK_RND_VX_BYTE:
-            # Vx = Random BYTE & kk
-            msg = fr"{op_code_hex} : Set Vx = random byte AND kk"
-            self.debug_print(msg)
-
-            random_byte = random.getrandbits(8)
-            ans = random_byte & kk
-            self.V[x] = ans
-
-        elif instruction == OpCodes._DXYN_DRW_VX_VY:
-            # Display n-bytes sprite starting at location I at (Vx,Vy)
-            msg = fr"{op_code_hex} : Drawing Sprite"
-            self.debug_print(msg)
-
-            sprite = self.memory[self.I: self.I + n]
-            location_x = self.V[x]
-            location_y = self.V[y]
-            collision = self.screen.draw_sprite(sprite, location_x, location_y)
-            self.V[0xF] = collision
-
-        elif instruction == OpCodes._E09E_SKP_VX:
-            # Skip next instruction if key with the value of Vx is pressed.
-            msg = fr"{op_code_hex} : Set next instruction if Vx pressed"
-            self.debug_print(msg)
-
-            key = self.V[x]
-            self.handle_keys()
-            if self.keys[key] == True:
-                self.increment_counter()
-
-        elif instruction == OpCodes._EXA1_SKPN_VX:
-            # Skip next instruction if key with the value of Vx is not pressed.
-            msg = fr"{op_code_hex} : Set next instruction if Vx not pressed"
-            self.debug_print(msg)
-
-            key = self.V[x]
-            self.handle_keys()
-            if self.keys[key] == False:
-                self.increment_counter()
-
-        elif instruction == OpCodes._FX07_LD_VX_DT:
-            # Set Vx = delay timer value.
-            msg = fr"{op_code_hex} : Set Vx = delay timer value"
-            self.debug_print(msg)
-
-            self.V[x] = self.delay_timer
-
-        elif instruction == OpCodes._FX0A_LD_VX_K:
-            # Wait for a key press, store the value of the key in Vx.
-            msg = fr"{op_code_hex} : Wait for a key press, store the value of the key in Vx"
-            self.debug_print(msg)
-
-            key = None
-            while True:
-                self.handle_keys()
-                key_down = False
-                for i in range(len(self.keys)):
-                    if self.keys[i] == True:
-                        key = i
-                        key_down = True
-                if key_down == True:
-                    break
+        handler = self._handlers[instruction]
+        handler(self, *self.get_arguments(op_code))
+
+    # Instruction handlers, all take the same pre-extracted operands
+
+    def _op_invalid(self, x, y, kk, nnn, n):
+        raise InvalidOpcode((self.memory[self.PC] << 8) | self.memory[self.PC + 1], self.PC)
+
+    def _op_00e0_cls(self, x, y, kk, nnn, n):
+        self.screen.clear_screen()
+
+    def _op_00ee_ret(self, x, y, kk, nnn, n):
+        # Return from subroutine
+        self.PC = self.stack[self.stack_pointer]
+        self.stack_pointer = self.stack_pointer - 1
+
+    def _op_0nnn_sys(self, x, y, kk, nnn, n):
+        # Ignored by modern interpreters
+        pass
+
+    def _op_1nnn_jp(self, x, y, kk, nnn, n):
+        # sets the program counter to nnn.
+        pc = self.PC
+        self.PC = nnn - 2
+        # Jumping to itself, or back into a delay timer wait,
+        # idles until the frame ends
+        if nnn == pc:
+            raise Idle(1)
+        if nnn == pc - 4:
+            register = self.delay_wait(nnn)
+            if register is not None:
+                raise Idle(3, register)
+
+    def _op_2nnn_call(self, x, y, kk, nnn, n):
+        # Call Subroutine nnn
+        self.stack_pointer = self.stack_pointer + 1
+        self.stack[self.stack_pointer] = self.PC
+        self.PC = nnn - 2
+
+    def _op_3xkk_se(self, x, y, kk, nnn, n):
+        # Skip next instruction if V[x] == KK
+        if self.V[x] == kk:
+            self.PC += 2
+
+    def _op_4xkk_sne(self, x, y, kk, nnn, n):
+        # Skip next instruction if V[x] != KK
+        if self.V[x] != kk:
+            self.PC += 2
+
+    def _op_5xy0_se(self, x, y, kk, nnn, n):
+        # Skip next instruction if v[x] == v[y]
+        if self.V[x] == self.V[y]:
+            self.PC += 2
+
+    def _op_6xkk_ld(self, x, y, kk, nnn, n):
+        # Put value kk in V[x]
+        self.V[x] = kk
+
+    def _op_7xkk_add(self, x, y, kk, nnn, n):
+        # Vx = Vx + kk, no carry
+        self.V[x] = (self.V[x] + kk) & 0xFF
+
+    def _op_8xy0_ld(self, x, y, kk, nnn, n):
+        # Set Vx = Vy.
+        self.V[x] = self.V[y]
+
+    def _op_8xy1_or(self, x, y, kk, nnn, n):
+        # Set Vx = Vx OR Vy
+        self.V[x] = self.V[x] | self.V[y]
+
+    def _op_8xy2_and(self, x, y, kk, nnn, n):
+        # Set Vx = Vx AND Vy
+        self.V[x] = self.V[x] & self.V[y]
+
+    def _op_8xy3_xor(self, x, y, kk, nnn, n):
+        # Set Vx = Vx XOR Vy
+        self.V[x] = self.V[x] ^ self.V[y]
+
+    def _op_8xy4_add(self, x, y, kk, nnn, n):
+        # Set Vx = Vx + Vy, set VF = carry.
+        ans, carry = self.add(self.V[x], self.V[y])
+        self.V[x] = ans
+        self.V[0xF] = 1 if carry else 0
+
+    def _op_8xy5_sub(self, x, y, kk, nnn, n):
+        # Set Vx = Vx - Vy, set VF = NOT borrow
+        ans, carry = self.sub(self.V[x], self.V[y])
+        self.V[0xF] = 0 if carry else 1
+        self.V[x] = ans
+
+    def _op_8xy6_shr(self, x, y, kk, nnn, n):
+        # Set Vx = Vx SHR 1, set VF = Overflow
+        lower_digit = self.V[x] & 1
+        self.V[x] = self.V[x] >> 1
+        self.V[0xF] = lower_digit
+
+    def _op_8xy7_subn(self, x, y, kk, nnn, n):
+        # Set Vx = Vy - Vx, set VF = NOT borrow
+        ans, carry = self.sub(self.V[y], self.V[x])
+        self.V[0xF] = 0 if carry else 1
+        self.V[x] = ans
+
+    def _op_8xye_shl(self, x, y, kk, nnn, n):
+        # Set Vx = Vx SHL 1
+        # If the most-significant bit of Vx is 1,
+        # then VF is set to 1, otherwise to 0
+        msb_is_one = ((self.V[x] & 0x80) == 0x80)
+        self.V[0xF] = 1 if msb_is_one else 0
+        self.V[x] = ((self.V[x] << 1) & 0xFF)
+
+    def _op_9xy0_sne(self, x, y, kk, nnn, n):
+        # Skip next instruction if Vx != Vy
+        if self.V[x] != self.V[y]:
+            self.PC += 2
+
+    def _op_annn_ld_i(self, x, y, kk, nnn, n):
+        # Set IndexRegister to nnn
+        self.I = nnn
+
+    def _op_bnnn_jp_v0(self, x, y, kk, nnn, n):
+        # Set PC to nnn + V[0]
+        self.PC = nnn + self.V[0] - 2
+
+    def _op_cxkk_rnd(self, x, y, kk, nnn, n):
+        # Vx = Random BYTE & kk
+        self.V[x] = self.random_byte() & kk
+
+    def _op_dxyn_drw(self, x, y, kk, nnn, n):
+        # Display n-bytes sprite starting at location I at (Vx,Vy)
+        sprite = self.memory[self.I: self.I + n]
+        collision = self.screen.draw_sprite(sprite, self.V[x], self.V[y])
+        self.V[0xF] = collision
+
+    def _op_ex9e_skp(self, x, y, kk, nnn, n):
+        # Skip next instruction if key with the value of Vx is pressed.
+        key = self.V[x]
+        if self.keys[key] == True:
+            self.PC += 2
+
+    def _op_exa1_sknp(self, x, y, kk, nnn, n):
+        # Skip next instruction if key with the value of Vx is not pressed.
+        key = self.V[x]
+        if self.keys[key] == False:
+            self.PC += 2
+
+    def _op_fx07_ld_vx_dt(self, x, y, kk, nnn, n):
+        # Set Vx = delay timer value.
+        self.V[x] = self.delay_timer
+
+    def _op_fx0a_ld_vx_k(self, x, y, kk, nnn, n):
+        # Wait for a key press, store the value of the key in Vx.
+        # The keys are polled at the end of every frame
+        key = None
+        for i in range(len(self.keys)):
+            if self.keys[i] == True:
+                key = i
+        if key is None:
+            # No key is down yet, execute this instruction again,
+            # the keys can only change when the frame ends
+            self.PC = self.PC - 2
+            raise Idle(1)
+        else:
             self.V[x] = key
 
-        elif instruction == OpCodes._FX15_LD_DT_VX:
-            # Set delay timer = Vx.
-            msg = fr"{op_code_hex} : Set delay timer = Vx"
-            self.debug_print(msg)
-
-            self.delay_timer = self.V[x]
-
-        elif instruction == OpCodes._FX18_LD_ST_VX:
-            # Set sound timer = Vx.
-            msg = fr"{op_code_hex} : Set sound timer = Vx"
-            self.debug_print(msg)
-
-            self.sound_timer = self.V[x]
-
-        elif instruction == OpCodes._FX1E_ADD_I_VX:
-            # Set I = I + Vx.
-            msg = fr"{op_code_hex} : Set I = I + Vx"
-            self.debug_print(msg)
-
-            # I is 16-bit register
-            ans, carry = self.add(self.I, self.V[x], bits=16)
-            self.I = ans
-
-        elif instruction == OpCodes._FX29_LD_F_VX:
-            # Set I to the memory address of the sprite data corresponding
-            # to the hexadecimal digit stored in register VX
-            msg = fr"{op_code_hex} : Set I to SPRITE location"
-            self.debug_print(msg)
-
-            sprite_digit = self.V[x]
-            sprite_location = sprite_digit * 5
-            self.I = sprite_location
-
-        elif instruction == OpCodes._FX33_LD_B_VX:
-            msg = fr"{op_code_hex} : Store BCD represntation"
-            self.debug_print(msg)
-
-            bcd = self.to_bcd(self.V[x])
-            for i in range(3):
-                self.memory[self.I + i] = bcd[i]
-
-        elif instruction == OpCodes._FX55_LD_I_VX:
-            # Store registers V0 through Vx in memory starting at location I.
-            msg = fr"{op_code_hex} : Store registers V0 through Vx in memory starting at location I"
-            self.debug_print(msg)
-
-            for i in range(x + 1):
-                self.memory[self.I + i] = self.V[i]
-
-        elif instruction == OpCodes._FX65_LD_VX_I:
-            # Read registers V0 through Vx from memory starting at location I.
-            msg = fr"{op_code_hex} : Load registers from memory"
-            self.debug_print(msg)
-
-            for i in range(x + 1):
-                self.V[i] = self.memory[self.I + i]
-
-    def to_bcd(self, number):
-        # 5 6 8
-        # Will be =>
-        # [ 5 , 6 , 8 ]
-
-        str_number = str(number).zfill(3)
-        bcd = []
-        for i in str_number:
-            bcd.append(int(i))
-        return bcd
+    def _op_fx15_ld_dt_vx(self, x, y, kk, nnn, n):
+        # Set delay timer = Vx.
+        self.delay_timer = self.V[x]
+
+    def _op_fx18_ld_st_vx(self, x, y, kk, nnn, n):
+        # Set sound timer = Vx.
+        self.sound_timer = self.V[x]
+
+    def _op_fx1e_add_i_vx(self, x, y, kk, nnn, n):
+        # Set I = I + Vx.
+        # I is 16-bit register
+        self.I = (self.I + self.V[x]) & 0xFFFF
+
+    def _op_fx29_ld_f_vx(self, x, y, kk, nnn, n):
+        # Set I to the memory address of the sprite data corresponding
+        # to the hexadecimal digit stored in register VX
+        self.I = self.V[x] * 5
+
+    def _op_fx33_ld_b_vx(self, x, y, kk, nnn, n):
+        # Store BCD represntation
+        value = self.V[x]
+        self.check_memory_range(self.I, 3)
+        self.memory[self.I:self.I + 3] = bytes((value // 100, value // 10 % 10, value % 10))
+
+    def _op_fx55_ld_i_vx(self, x, y, kk, nnn, n):
+        # Store registers V0 through Vx in memory starting at location I.
+        self.check_memory_range(self.I, x + 1)
+        self.memory[self.I:self.I + x + 1] = bytes(self.V[:x + 1])
+
+    def _op_fx65_ld_vx_i(self, x, y, kk, nnn, n):
+        # Read registers V0 through Vx from memory starting at location I.
+        self.check_memory_range(self.I, x + 1)
+        self.V[:x + 1] = self.memory[self.I:self.I + x + 1]
+
+    def check_memory_range(self, start, length):
+        # Slices never fail, so out of range transfers are caught here
+        if start + length > self.MEMORY_SIZE:
+            raise IndexError(f"Memory access {start:#05x}-{start + length - 1:#05x} out of range")
+
+    _handlers = {
+        OpCodes._NO_OPCODE: _op_invalid,
+        OpCodes._00E0_CLS: _op_00e0_cls,
+        OpCodes._00E0_RET: _op_00ee_ret,
+        OpCodes._0NNN_SYS_ADDR: _op_0nnn_sys,
+        OpCodes._1NNN_JP_ADDR: _op_1nnn_jp,
+        OpCodes._2NNN_CALL_ADDR: _op_2nnn_call,
+        OpCodes._3XKK_SE_VX_BYTE: _op_3xkk_se,
+        OpCodes._4XKK_SNE_VX_BYTE: _op_4xkk_sne,
+        OpCodes._5XY0_SE_VX_VY: _op_5xy0_se,
+        OpCodes._6XKK_LD_VX_BYTE: _op_6xkk_ld,
+        OpCodes._7XKK_ADD_VX_BYTE: _op_7xkk_add,
+        OpCodes._8XY0_LD_VX_VY: _op_8xy0_ld,
+        OpCodes._8XY1_OR_VX_VY: _op_8xy1_or,
+        OpCodes._8XY2_AND_VX_VY: _op_8xy2_and,
+        OpCodes._8XY3_XOR_VX_VY: _op_8xy3_xor,
+        OpCodes._8XY4_ADD_VX_VY: _op_8xy4_add,
+        OpCodes._8xy5_SUB_VX_VY: _op_8xy5_sub,
+        OpCodes._8XY6_SHR_VX: _op_8xy6_shr,
+        OpCodes._8XY7_SUBN_VX_VY: _op_8xy7_subn,
+        OpCodes._820E_SHL_VX: _op_8xye_shl,
+        OpCodes._9XY0_SNE_VX_VY: _op_9xy0_sne,
+        OpCodes._ANNN_LD_I_ADDR: _op_annn_ld_i,
+        OpCodes._BNNN_JP_V0_ADDR: _op_bnnn_jp_v0,
+        OpCodes._CKKK_RND_VX_BYTE: _op_cxkk_rnd,
+        OpCodes._DXYN_DRW_VX_VY: _op_dxyn_drw,
+        OpCodes._E09E_SKP_VX: _op_ex9e_skp,
+        OpCodes._EXA1_SKPN_VX: _op_exa1_sknp,
+        OpCodes._FX07_LD_VX_DT: _op_fx07_ld_vx_dt,
+        OpCodes._FX0A_LD_VX_K: _op_fx0a_ld_vx_k,
+        OpCodes._FX15_LD_DT_VX: _op_fx15_ld_dt_vx,
+        OpCodes._FX18_LD_ST_VX: _op_fx18_ld_st_vx,
+        OpCodes._FX1E_ADD_I_VX: _op_fx1e_add_i_vx,
+        OpCodes._FX29_LD_F_VX: _op_fx29_ld_f_vx,
+        OpCodes._FX33_LD_B_VX: _op_fx33_ld_b_vx,
+        OpCodes._FX55_LD_I_VX: _op_fx55_ld_i_vx,
+        OpCodes._FX65_LD_VX_I: _op_fx65_ld_vx_i,
+    }
+
+    # Op code -> (handler, x, y, kk, nnn, n), filled by predecode
+    # and shared by every instance since it only depends on the op code
+    _dispatch = {}
 
     def add(self, one, two, bits=8):
         # Number of bits with AND operation
@@ -479,11 +697,3 @@ class Chip8:
         borrow = two > one
         c = (abs(one - two) & 0xFF)
         return c, borrow
-
-
-    def format_to_hex(self, number):
-        return f"{number:#0{6}x}"
-
-    def debug_print(self, string):
-        if constants.DEBUG_PRINT:
-            print(string)
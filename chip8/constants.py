@@ -2,5 +2,16 @@ BACKGROUND_COLOR = (61, 31, 43)
 ACTIVE_COLOR = (255, 255, 255)
 
 SCREEN_SCALE = 15
+# "rect" draws each lit pixel, "numpy" blits the whole frame with NumPy
+RENDERER = "rect"
 CLOCK_SPEED = 500
+TIMER_SPEED = 60
+
+# Run uncapped, presenting one frame out of every FRAME_SKIP + 1
+TURBO = False
+FRAME_SKIP = 0
+
+# Emulate in a thread of its own, presenting the newest frame from the main thread
+THREADED = False
+
 DEBUG_PRINT = False
@@ -0,0 +1,241 @@
+import ast
+import builtins
+
+from chip8.chip8 import Idle
+
+# Names a breakpoint condition can use -> the Chip8 attribute they read
+CONDITION_NAMES = {
+    "V": "V",
+    "I": "I",
+    "PC": "PC",
+    "DT": "delay_timer",
+    "ST": "sound_timer",
+    "SP": "stack_pointer",
+    "stack": "stack",
+    "memory": "memory",
+    "keys": "keys",
+    "frame": "frame_count",
+    "cycle": "cycle_count",
+}
+
+
+class Break(Exception):
+    # Raised out of chip8.run() when a breakpoint or a watchpoint is hit.
+    # A breakpoint stops before the instruction at pc runs, a watchpoint
+    # right after the instruction at pc accessed memory from start to end.
+    def __init__(self, reason, pc, condition=None, start=None, end=None, access=None, old=None, new=None):
+        super().__init__(reason, pc)
+        self.reason = reason
+        self.pc = pc
+        self.condition = condition
+        self.start = start
+        self.end = end
+        self.access = access
+        self.old = old
+        self.new = new
+
+    def __str__(self):
+        if self.reason == "breakpoint":
+            text = f"Breakpoint at {self.pc:#05x}"
+            if self.condition:
+                text += f" when {self.condition}"
+            return text
+        text = f"{self.access.capitalize()} of {self.start:#05x}-{self.end - 1:#05x} at {self.pc:#05x}"
+        if self.access == "write":
+            text += f", {self.old.hex()} -> {self.new.hex()}"
+        return text
+
+
+class Debugger:
+    # PC breakpoints, conditional breakpoints and memory watchpoints.
+    # Conditions are Python expressions over V, I, PC, DT, ST, SP, stack,
+    # memory, keys, frame and cycle, compiled once into a function when
+    # they are added. Watchpoints catch the memory DXYN and FX65 read and
+    # FX33 and FX55 write.
+    # While anything is armed the machine runs its instructions through
+    # Debugger.execute, an interpreter loop with the checks added. With
+    # nothing armed chip8.debugger is None and the usual execution path
+    # runs without a single extra check.
+    #
+    # Usage:
+    #     debugger = Debugger(chip8)
+    #     debugger.add_breakpoint(0x2A4, "V[3] == 0x10")
+    #     debugger.add_watchpoint(0x300, 0x310, read=False)
+    #     try:
+    #         chip8.run(100000)
+    #     except Break as hit:
+    #         print(hit)
+    #     chip8.run(100000)  # continues from where it stopped
+
+    def __init__(self, chip8):
+        self.chip8 = chip8
+
+        # PC -> {condition or None: check function or None}
+        self.breakpoints = {}
+
+        # Condition -> check function, tested before every instruction
+        self.conditions = {}
+
+        # (start, end, read, write)
+        self.watchpoints = []
+
+        # Address of the breakpoint execution stopped at, which is not hit
+        # again when execution continues from there
+        self.resume_pc = None
+
+        self.hits = 0
+
+    def add_breakpoint(self, pc=None, condition=None):
+        # Break before the instruction at pc runs, only when condition holds
+        # if one is given. Without a pc the condition is tested everywhere.
+        if pc is None and condition is None:
+            raise ValueError("A breakpoint needs a pc, a condition or both")
+        check = self.compile_condition(condition) if condition else None
+        if pc is None:
+            self.conditions[condition] = check
+        else:
+            self.breakpoints.setdefault(pc, {})[condition] = check
+        self.arm()
+
+    def remove_breakpoint(self, pc=None, condition=None):
+        if pc is None:
+            self.conditions.pop(condition, None)
+        elif pc in self.breakpoints:
+            self.breakpoints[pc].pop(condition, None)
+            if not self.breakpoints[pc]:
+                del self.breakpoints[pc]
+        self.arm()
+
+    def add_watchpoint(self, start, end=None, read=True, write=True):
+        # Break after an instruction reads or writes memory from start to end
+        if end is None:
+            end = start + 1
+        self.watchpoints.append((start, end, read, write))
+        self.arm()
+
+    def remove_watchpoint(self, start, end=None):
+        if end is None:
+            end = start + 1
+        self.watchpoints = [watchpoint for watchpoint in self.watchpoints if watchpoint[:2] != (start, end)]
+        self.arm()
+
+    def clear(self):
+        self.breakpoints.clear()
+        self.conditions.clear()
+        self.watchpoints = []
+        self.arm()
+
+    def arm(self):
+        # Swap the checking loop in only while something can be hit
+        armed = self.breakpoints or self.conditions or self.watchpoints
+        self.chip8.debugger = self if armed else None
+
+    @staticmethod
+    def compile_condition(condition):
+        # A function of the machine returning whether condition holds,
+        # binding only the names the condition uses
+        # Only the names read, not attributes like keys.count or the
+        # variables of a comprehension
+        read = set()
+        assigned = set()
+        for node in ast.walk(ast.parse(condition, mode="eval")):
+            if isinstance(node, ast.Name):
+                (assigned if isinstance(node.ctx, ast.Store) else read).add(node.id)
+        lines = ["def check(chip8):"]
+        for name in sorted(read - assigned):
+            if name in CONDITION_NAMES:
+                lines.append(f"    {name} = chip8.{CONDITION_NAMES[name]}")
+            elif not hasattr(builtins, name):
+                raise ValueError(f"Unknown name {name} in condition {condition!r}")
+        lines.append(f"    return bool({condition})")
+        namespace = {}
+        exec(compile("\n".join(lines), f"<condition {condition}>", "exec"), namespace)
+        return namespace["check"]
+
+    def execute(self, cycles):
+        chip8 = self.chip8
+        memory = chip8.memory
+        dispatch = chip8._dispatch
+        breakpoints = self.breakpoints
+        conditions = self.conditions.items()
+        watchpoints = self.watchpoints
+        executed = 0
+        while executed < cycles:
+            pc = chip8.PC
+            if pc == self.resume_pc:
+                self.resume_pc = None
+            else:
+                checks = breakpoints.get(pc)
+                if checks is not None:
+                    for condition, check in checks.items():
+                        if check is None or check(chip8):
+                            self.stop(executed, Break("breakpoint", pc, condition))
+                for condition, check in conditions:
+                    if check(chip8):
+                        self.stop(executed, Break("breakpoint", pc, condition))
+
+            op_code = (memory[pc] << 8) | memory[pc + 1]
+            entry = dispatch.get(op_code)
+            if entry is None:
+                entry = chip8.predecode(op_code)
+            handler, x, y, kk, nnn, n = entry
+
+            access = None
+            if op_code & 0xF000 == 0xD000:
+                access, start, end = "read", chip8.I, chip8.I + n
+            elif op_code & 0xF0FF == 0xF065:
+                access, start, end = "read", chip8.I, chip8.I + x + 1
+            elif op_code & 0xF0FF == 0xF033:
+                access, start, end = "write", chip8.I, chip8.I + 3
+            elif op_code & 0xF0FF == 0xF055:
+                access, start, end = "write", chip8.I, chip8.I + x + 1
+            if access == "write":
+                old = bytes(memory[start:end])
+
+            try:
+                handler(chip8, x, y, kk, nnn, n)
+            except Idle as idle:
+                if self.watched_loop(idle):
+                    # Spin through the loop one instruction at a time
+                    chip8.skip_idle(idle, 0)
+                else:
+                    rest = chip8.skip_idle(idle, cycles - executed - 1)
+                    executed = cycles - rest - 1
+                executed += 1
+                continue
+            chip8.PC += 2
+            executed += 1
+
+            if access is None:
+                continue
+            if access == "write" and chip8.engine is not None:
+                # Written behind the back of the engine's cached code
+                chip8.engine.invalidate(start, end)
+            for watch_start, watch_end, read, write in watchpoints:
+                if watch_start < end and start < watch_end and (read if access == "read" else write):
+                    if access == "write":
+                        hit = Break("watchpoint", pc, None, start, end, access, old, bytes(memory[start:end]))
+                    else:
+                        hit = Break("watchpoint", pc, None, start, end, access)
+                    self.stop(executed, hit)
+
+    def watched_loop(self, idle):
+        # Whether skipping the idle loop the machine is in would skip a breakpoint
+        if self.conditions:
+            return True
+        start = self.chip8.PC + 2
+        return any(start + 2 * i in self.breakpoints for i in range(idle.length))
+
+    def stop(self, executed, hit):
+        # Account for the instructions run so far in this chunk, as run()
+        # would have, and leave run()
+        chip8 = self.chip8
+        chip8.cycle_count += executed
+        chip8.frame_cycle += executed
+        if chip8.frame_cycle >= chip8.cycles_per_frame:
+            # Hit on the last instruction of the frame
+            chip8.end_frame()
+        if hit.reason == "breakpoint":
+            self.resume_pc = hit.pc
+        self.hits += 1
+        raise hit
@@ -41,6 +41,29 @@ class OpCodes(Enum):
 
 
 class Decoder:
+    # Built once instead of on every decode
+    _8xy_map = {
+        0x0: OpCodes._8XY0_LD_VX_VY,
+        0x1: OpCodes._8XY1_OR_VX_VY,
+        0x2: OpCodes._8XY2_AND_VX_VY,
+        0x3: OpCodes._8XY3_XOR_VX_VY,
+        0x4: OpCodes._8XY4_ADD_VX_VY,
+        0x5: OpCodes._8xy5_SUB_VX_VY,
+        0x6: OpCodes._8XY6_SHR_VX,
+        0x7: OpCodes._8XY7_SUBN_VX_VY,
+        0xE: OpCodes._820E_SHL_VX,
+    }
+    _fx_map = {
+        0x07: OpCodes._FX07_LD_VX_DT,
+        0x0A: OpCodes._FX0A_LD_VX_K,
+        0x15: OpCodes._FX15_LD_DT_VX,
+        0x18: OpCodes._FX18_LD_ST_VX,
+        0x1E: OpCodes._FX1E_ADD_I_VX,
+        0x29: OpCodes._FX29_LD_F_VX,
+        0x33: OpCodes._FX33_LD_B_VX,
+        0x55: OpCodes._FX55_LD_I_VX,
+        0x65: OpCodes._FX65_LD_VX_I,
+    }
 
     @staticmethod
     def decode(op_code):
@@ -71,18 +94,7 @@ class Decoder:
             res = OpCodes._7XKK_ADD_VX_BYTE
         elif var == 0x8000:
             last_digit = op_code & 0x000F
-            switch_map = {
-                0x0: OpCodes._8XY0_LD_VX_VY,
-                0x1: OpCodes._8XY1_OR_VX_VY,
-                0x2: OpCodes._8XY2_AND_VX_VY,
-                0x3: OpCodes._8XY3_XOR_VX_VY,
-                0x4: OpCodes._8XY4_ADD_VX_VY,
-                0x5: OpCodes._8xy5_SUB_VX_VY,
-                0x6: OpCodes._8XY6_SHR_VX,
-                0x7: OpCodes._8XY7_SUBN_VX_VY,
-                0xE: OpCodes._820E_SHL_VX,
-            }
-            res = switch_map[last_digit]
+            res = Decoder._8xy_map.get(last_digit, OpCodes._NO_OPCODE)
         elif var == 0x9000:
             res = OpCodes._9XY0_SNE_VX_VY
         elif var == 0xA000:
@@ -100,17 +112,15 @@ class Decoder:
                 res = OpCodes._EXA1_SKPN_VX
         elif var == 0xF000:
             last_digit = op_code & 0x00FF
-            switch_map = {
-                0x07: OpCodes._FX07_LD_VX_DT,
-                0x0A: OpCodes._FX0A_LD_VX_K,
-                0x15: OpCodes._FX15_LD_DT_VX,
-                0x18: OpCodes._FX18_LD_ST_VX,
-                0x1E: OpCodes._FX1E_ADD_I_VX,
-                0x29: OpCodes._FX29_LD_F_VX,
-                0x33: OpCodes._FX33_LD_B_VX,
-                0x55: OpCodes._FX55_LD_I_VX,
-                0x65: OpCodes._FX65_LD_VX_I,
-            }
-            res = switch_map[last_digit]
+            res = Decoder._fx_map.get(last_digit, OpCodes._NO_OPCODE)
 
         return res
+
+    @staticmethod
+    def mnemonic(op_code):
+        # Short name for listings, "???" when it is not an instruction
+        instruction = Decoder.decode(op_code)
+        if instruction == OpCodes._NO_OPCODE:
+            return "???"
+        # _7XKK_ADD_VX_BYTE => ADD_VX_BYTE
+        return instruction.name.split("_", 2)[2]
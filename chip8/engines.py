@@ -0,0 +1,20 @@
+# Names of the execution engines a Chip8 can run its instructions with,
+# the choices of every --engine option. "interpreter" is Chip8's own loop.
+ENGINES = ["interpreter", "recompiler", "fusion"]
+
+
+def attach(chip8, name):
+    # Sets chip8.engine to a new engine of that name and returns it, None
+    # for the interpreter. The engines are only imported when attached, so
+    # a plain machine never loads them.
+    if name == "interpreter":
+        chip8.engine = None
+    elif name == "recompiler":
+        from chip8.recompiler import Recompiler
+        chip8.engine = Recompiler(chip8)
+    elif name == "fusion":
+        from chip8.fusion import Fusion
+        chip8.engine = Fusion(chip8)
+    else:
+        raise ValueError(f"Unknown engine {name}, expected one of {', '.join(ENGINES)}")
+    return chip8.engine
@@ -0,0 +1,145 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from multiprocessing import shared_memory
+
+from chip8.chip8 import Chip8
+from chip8.engines import ENGINES, attach
+from chip8.framebuffer import FrameBuffer
+from chip8.frontend import ScriptedFrontend
+
+# Bytes of one framebuffer in the shared block, see FrameBuffer.to_bytes()
+FRAMEBUFFER_SIZE = FrameBuffer.HEIGHT * FrameBuffer.WIDTH // 8
+
+
+class Job:
+    # One headless emulator instance to run in the fleet.
+    # The seed drives both CXKK and the scripted key presses,
+    # unless a script of (frame, key, pressed) events is given.
+
+    def __init__(self, rom_path, seed=0, cycles=100000, engine="interpreter", events=None):
+        self.rom_path = rom_path
+        self.seed = seed
+        self.cycles = cycles
+        self.engine = engine
+        self.events = events
+
+
+class Fleet:
+    # Runs many Chip8 instances over a pool of worker processes.
+    # Workers write each final framebuffer straight into one shared memory
+    # block, only the small register and stats dicts are pickled back.
+    #
+    # Usage:
+    #     jobs = [Job(rom, seed) for rom in roms for seed in range(100)]
+    #     for result in Fleet().run(jobs):
+    #         print(result["rom"], result["seed"], result["PC"])
+
+    def __init__(self, processes=None):
+        self.processes = processes or os.cpu_count() or 1
+
+    def run(self, jobs):
+        # One result dict per job, in the order of `jobs`
+        jobs = list(jobs)
+        if not jobs:
+            return []
+
+        framebuffers = shared_memory.SharedMemory(create=True, size=len(jobs) * FRAMEBUFFER_SIZE)
+        try:
+            results = [None] * len(jobs)
+            processes = min(self.processes, len(jobs))
+            # A few chunks per worker keeps them all busy until the end
+            chunk_size = max(1, len(jobs) // (processes * 4))
+            with multiprocessing.Pool(processes, _attach, (framebuffers.name,)) as pool:
+                for result in pool.imap_unordered(_run_job, enumerate(jobs), chunk_size):
+                    results[result["index"]] = result
+
+            for index, result in enumerate(results):
+                offset = index * FRAMEBUFFER_SIZE
+                result["framebuffer"] = bytes(framebuffers.buf[offset:offset + FRAMEBUFFER_SIZE])
+        finally:
+            framebuffers.close()
+            framebuffers.unlink()
+        return results
+
+
+# Per worker process state, set up once by _attach
+_framebuffers = None
+_roms = {}
+
+
+def _attach(name):
+    global _framebuffers
+    _framebuffers = shared_memory.SharedMemory(name=name)
+
+
+def _run_job(indexed_job):
+    index, job = indexed_job
+
+    if job.rom_path not in _roms:
+        with open(job.rom_path, "rb") as f:
+            _roms[job.rom_path] = f.read()
+
+    chip8 = Chip8(seed=job.seed)
+    events = job.events
+    if events is None:
+        frames = job.cycles // chip8.cycles_per_frame + 1
+        events = ScriptedFrontend.random_presses(frames, job.seed)
+    chip8.frontend = ScriptedFrontend(events)
+    chip8.load_rom(_roms[job.rom_path], name=job.rom_path)
+    chip8.initialize()
+    attach(chip8, job.engine)
+
+    error = None
+    start = time.perf_counter()
+    try:
+        chip8.run(job.cycles)
+    except (IndexError, ValueError) as e:
+        # e.g. a stack overflow, the state at that point is still returned
+        error = f"{type(e).__name__}: {e}"
+    elapsed = time.perf_counter() - start
+
+    offset = index * FRAMEBUFFER_SIZE
+    _framebuffers.buf[offset:offset + FRAMEBUFFER_SIZE] = chip8.screen.to_bytes()
+
+    return {
+        "index": index,
+        "rom": job.rom_path,
+        "seed": job.seed,
+        "error": error,
+        "V": list(chip8.V),
+        "I": chip8.I,
+        "PC": chip8.PC,
+        "stack": chip8.stack[:chip8.stack_pointer + 1],
+        "delay_timer": chip8.delay_timer,
+        "sound_timer": chip8.sound_timer,
+        "cycles": chip8.cycle_count,
+        "frames": chip8.frame_count,
+        "seconds": elapsed,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run every ROM with many input seeds over a process pool")
+    parser.add_argument("roms", nargs="+")
+    parser.add_argument("--seeds", type=int, default=8, help="input seeds per ROM")
+    parser.add_argument("--cycles", type=int, default=100000, help="instructions per instance")
+    parser.add_argument("--processes", type=int, help="worker processes, one per core by default")
+    parser.add_argument("--engine", choices=ENGINES, default="interpreter")
+    args = parser.parse_args()
+
+    fleet_jobs = [Job(rom, seed, args.cycles, args.engine) for rom in args.roms for seed in range(args.seeds)]
+    fleet = Fleet(args.processes)
+    fleet_start = time.perf_counter()
+    fleet_results = fleet.run(fleet_jobs)
+    fleet_elapsed = time.perf_counter() - fleet_start
+
+    for fleet_result in fleet_results:
+        status = fleet_result["error"] or "ok"
+        print(f"{os.path.basename(fleet_result['rom']):<18} seed {fleet_result['seed']:<4} "
+              f"PC={fleet_result['PC']:#05x} frames={fleet_result['frames']:<6} {status}")
+    total_cycles = sum(fleet_result["cycles"] for fleet_result in fleet_results)
+    print(f"{len(fleet_jobs)} instances on {fleet.processes} processes in {fleet_elapsed:.2f}s, "
+          f"{total_cycles / fleet_elapsed:,.0f} instructions/sec", file=sys.stderr)
@@ -0,0 +1,55 @@
+class FrameBuffer:
+    HEIGHT = 32
+    WIDTH = 64
+
+    # Each row is one 64-bit integer, the left-most pixel is the highest bit
+    ROW_MASK = (1 << WIDTH) - 1
+
+    def __init__(self):
+        self.rows = [0] * self.HEIGHT
+
+        # Rows changed since the last time the screen was presented
+        self.dirty_rows = set()
+
+    def draw_sprite(self, sprite, x, y):
+        # Every sprite byte is rotated into place and XORed into its row,
+        # a collision is any bit set in both
+        rows = self.rows
+        shift = x % self.WIDTH
+        collision = 0
+        for j in range(len(sprite)):
+            byte = sprite[j]
+            if byte == 0:
+                # Nothing to flip on this row
+                continue
+            bits = byte << (self.WIDTH - 8)
+            if shift:
+                bits = ((bits >> shift) | (bits << (self.WIDTH - shift))) & self.ROW_MASK
+            location_y = (y + j) % self.HEIGHT
+            row = rows[location_y]
+            if row & bits:
+                collision = 1
+            rows[location_y] = row ^ bits
+            self.dirty_rows.add(location_y)
+        return collision
+
+    def clear_screen(self):
+        for i in range(self.HEIGHT):
+            if self.rows[i]:
+                self.rows[i] = 0
+                self.dirty_rows.add(i)
+
+    def take_dirty_rows(self):
+        # Return the changed rows in order and mark everything as presented
+        rows = sorted(self.dirty_rows)
+        self.dirty_rows.clear()
+        return rows
+
+    def to_bytes(self):
+        # 256 bytes, 8 per row
+        return b"".join(row.to_bytes(8, "big") for row in self.rows)
+
+    def load_bytes(self, data):
+        # Replace the screen with 256 bytes from to_bytes()
+        self.rows = [int.from_bytes(data[i:i + 8], "big") for i in range(0, self.HEIGHT * 8, 8)]
+        self.dirty_rows.update(range(self.HEIGHT))
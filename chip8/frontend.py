@@ -0,0 +1,75 @@
+class Frontend:
+    # The interface between the CPU core and the outside world.
+    # A frontend owns the display, the input devices and the audio,
+    # the core only talks to it through these methods.
+
+    # Whether a machine halted in a jump to itself may skip many frames
+    # at once, with a single poll_input() for all of them
+    skippable = False
+
+    def initialize(self):
+        pass
+
+    def poll_input(self, chip8):
+        # Update chip8.keys with the current state of the keypad
+        self.poll_keys(chip8.keys)
+
+    def poll_keys(self, keys):
+        # Update a list of the 16 key states, for input that doesn't depend
+        # on the machine, so another thread or a remote viewer can poll it
+        pass
+
+    def present(self, framebuffer):
+        pass
+
+    def play_beep(self):
+        pass
+
+
+class HeadlessFrontend(Frontend):
+    # No display, no input and no audio.
+    # Used to run the core in batch jobs at full interpreter speed.
+    skippable = True
+
+
+class ScriptedFrontend(HeadlessFrontend):
+    # Headless, with the keys driven by a script of
+    # (frame, key, pressed) events applied when that frame ends
+
+    def __init__(self, events):
+        self.events = sorted(events)
+        self.position = 0
+
+    def poll_input(self, chip8):
+        events = self.events
+        while self.position < len(events) and events[self.position][0] <= chip8.frame_count:
+            frame, key, pressed = events[self.position]
+            chip8.keys[key] = pressed
+            self.position += 1
+
+    @staticmethod
+    def round_robin(frames, hold=5, gap=5):
+        # Press every key in turn for `hold` frames, `gap` frames apart
+        events = []
+        key = 0
+        frame = gap
+        while frame + hold < frames:
+            events.append((frame, key, True))
+            events.append((frame + hold, key, False))
+            key = (key + 1) % 16
+            frame += hold + gap
+        return events
+
+    @staticmethod
+    def random_presses(frames, seed, hold=5, gap=5):
+        # Like round_robin, but the key pressed each time comes from `seed`
+        import random
+        rng = random.Random(seed)
+        events = []
+        frame = gap
+        while frame + hold < frames:
+            key = rng.randrange(16)
+            events.append((frame, key, True))
+            events.append((frame + hold, key, False))
+            frame += hold + gap
+        return events
@@ -0,0 +1,192 @@
+from chip8.chip8 import Chip8, Idle
+
+
+class Fusion:
+    # Optional execution engine for Chip8.
+    # Every address gets a dispatch entry, decoded the first time it runs,
+    # so running an instruction again is a list lookup instead of a fetch
+    # and a decode. A peephole pass replaces common sequences with single
+    # fused entries, their operands precomputed:
+    #   ANNN, DXYN                 set I and draw a sprite
+    #   7XKK, 3XKK or 4XKK         add to a counter and test it
+    #   FX07, 3XKK or 4XKK, 1NNN   wait for the delay timer
+    # Entries are keyed by address, so a jump into the middle of a fused
+    # sequence runs the single instruction there. FX33 and FX55 mark the
+    # entries reading what they wrote for decoding again, and a fused
+    # sequence is only used when the whole of it fits in the cycles left
+    # in the frame.
+    #
+    # Usage:
+    #     chip8.engine = Fusion(chip8)
+
+    def __init__(self, chip8):
+        self.chip8 = chip8
+
+        # Address -> (handler, x, y, kk, nnn, n, length), the handler of a
+        # fused entry returns the number of instructions it executed
+        self.code = []
+
+        # Address -> the entry of the single instruction there
+        self.single = []
+
+        # Entry of an address not decoded yet, or written since
+        self.stale = (self.decode, 0, 0, 0, 0, 0, 1)
+
+        self.fusions = 0
+        self.invalidations = 0
+
+        # Memory writers that invalidate what they overwrote
+        self.writers = {
+            Chip8._op_fx33_ld_b_vx: self._fx33_ld_b_vx,
+            Chip8._op_fx55_ld_i_vx: self._fx55_ld_i_vx,
+        }
+        self.invalidate_all()
+
+    def execute(self, cycles):
+        chip8 = self.chip8
+        code = self.code
+        single = self.single
+        while cycles > 0:
+            entry = code[chip8.PC]
+            if entry[6] > cycles:
+                entry = single[chip8.PC]
+            handler, x, y, kk, nnn, n, length = entry
+            try:
+                if length == 1:
+                    handler(chip8, x, y, kk, nnn, n)
+                    cycles -= 1
+                else:
+                    cycles -= handler(chip8, x, y, kk, nnn, n)
+            except Idle as idle:
+                # Only the last instruction of an entry can idle
+                cycles = chip8.skip_idle(idle, cycles - length)
+                continue
+            chip8.PC += 2
+
+    def invalidate_all(self):
+        # Forget every entry, e.g. after load_state()
+        size = len(self.chip8.memory) - 1
+        self.single[:] = [self.stale] * size
+        self.code[:] = [self.stale] * size
+
+    def invalidate(self, start, end):
+        # Memory between start and end changed, every entry reading from it
+        # is decoded again the next time it runs
+        self.invalidations += 1
+        size = len(self.code)
+        end = min(end, size)
+        first = max(0, start - 5)
+        self.code[first:end] = [self.stale] * (end - first)
+        first = max(0, start - 1)
+        self.single[first:end] = [self.stale] * (end - first)
+
+    def decode(self, chip8, x, y, kk, nnn, n):
+        # The handler of a stale entry: decode the instruction at PC, and the
+        # sequence starting there, then run the single instruction
+        pc = chip8.PC
+        memory = chip8.memory
+        op_code = (memory[pc] << 8) | memory[pc + 1]
+        entry = chip8._dispatch.get(op_code)
+        if entry is None:
+            entry = chip8.predecode(op_code)
+        handler = self.writers.get(entry[0], entry[0])
+        entry = (handler,) + entry[1:] + (1,)
+        self.single[pc] = entry
+
+        fused = self.fuse(pc)
+        if fused is not None:
+            self.fusions += 1
+        self.code[pc] = fused or entry
+        handler(chip8, *entry[1:6])
+
+    def fuse(self, pc):
+        # The fused entry of the sequence starting at pc, or None
+        memory = self.chip8.memory
+        if pc + 3 >= len(memory):
+            return None
+        first = memory[pc] >> 4
+        second = memory[pc + 2] >> 4
+        x = memory[pc] & 0x0F
+        kk = memory[pc + 1]
+        y = memory[pc + 2] & 0x0F
+        kk2 = memory[pc + 3]
+
+        if first == 0xA and second == 0xD:
+            nnn = (x << 8) | kk
+            return (_annn_dxyn, y, kk2 >> 4, 0, nnn, kk2 & 0x0F, 2)
+
+        if first == 0x7 and second in (0x3, 0x4):
+            handler = _7xkk_3xkk if second == 0x3 else _7xkk_4xkk
+            return (handler, x, y, kk, 0, kk2, 2)
+
+        if first == 0xF and kk == 0x07 and second in (0x3, 0x4) and pc + 5 < len(memory) and memory[pc + 4] >> 4 == 0x1:
+            handler = _fx07_3xkk_1nnn if second == 0x3 else _fx07_4xkk_1nnn
+            nnn = ((memory[pc + 4] & 0x0F) << 8) | memory[pc + 5]
+            return (handler, x, y, 0, nnn, kk2, 3)
+
+        return None
+
+    def _fx33_ld_b_vx(self, chip8, x, y, kk, nnn, n):
+        start = chip8.I
+        Chip8._op_fx33_ld_b_vx(chip8, x, y, kk, nnn, n)
+        self.invalidate(start, start + 3)
+
+    def _fx55_ld_i_vx(self, chip8, x, y, kk, nnn, n):
+        start = chip8.I
+        Chip8._op_fx55_ld_i_vx(chip8, x, y, kk, nnn, n)
+        self.invalidate(start, start + x + 1)
+
+
+# Fused handlers. They leave PC on the last instruction they executed,
+# like any handler, and return how many instructions that was
+
+def _annn_dxyn(chip8, x, y, kk, nnn, n):
+    # ANNN, then DXYN with x, y and n
+    chip8.I = nnn
+    chip8.PC += 2
+    Chip8._op_dxyn_drw(chip8, x, y, kk, nnn, n)
+    return 2
+
+
+def _7xkk_3xkk(chip8, x, y, kk, nnn, n):
+    # 7XKK with x and kk, then 3YNN with y and n
+    V = chip8.V
+    V[x] = (V[x] + kk) & 0xFF
+    chip8.PC += 2
+    if V[y] == n:
+        chip8.PC += 2
+    return 2
+
+
+def _7xkk_4xkk(chip8, x, y, kk, nnn, n):
+    # 7XKK with x and kk, then 4YNN with y and n
+    V = chip8.V
+    V[x] = (V[x] + kk) & 0xFF
+    chip8.PC += 2
+    if V[y] != n:
+        chip8.PC += 2
+    return 2
+
+
+def _fx07_3xkk_1nnn(chip8, x, y, kk, nnn, n):
+    # FX07 with x, 3YNN with y and n, then a jump to nnn unless skipped
+    V = chip8.V
+    V[x] = chip8.delay_timer
+    if V[y] == n:
+        chip8.PC += 4
+        return 2
+    chip8.PC += 4
+    Chip8._op_1nnn_jp(chip8, 0, 0, 0, nnn, 0)
+    return 3
+
+
+def _fx07_4xkk_1nnn(chip8, x, y, kk, nnn, n):
+    # FX07 with x, 4YNN with y and n, then a jump to nnn unless skipped
+    V = chip8.V
+    V[x] = chip8.delay_timer
+    if V[y] != n:
+        chip8.PC += 4
+        return 2
+    chip8.PC += 4
+    Chip8._op_1nnn_jp(chip8, 0, 0, 0, nnn, 0)
+    return 3
@@ -1,16 +1,19 @@
 import os
+import sys
 
 import pygame
 import chip8.constants as constants
+import chip8.keys as Keys
+from chip8.framebuffer import FrameBuffer
+from chip8.frontend import Frontend
 
 
 class Screen:
-    HEIGHT = 32
-    WIDTH = 64
+    HEIGHT = FrameBuffer.HEIGHT
+    WIDTH = FrameBuffer.WIDTH
 
-    def __init__(self):
-        self.scale = constants.SCREEN_SCALE
-        self.pixels = [[0 for i in range(self.WIDTH)] for j in range(self.HEIGHT)]
+    def __init__(self, scale=None):
+        self.scale = constants.SCREEN_SCALE if scale is None else scale
 
         self.background_color = constants.BACKGROUND_COLOR
         self.active_color = constants.ACTIVE_COLOR
@@ -21,30 +24,40 @@ class Screen:
         self.beep_sound = None
         self.display = None
 
-    def initialize(self):
-        pygame.init()
-
-        # The mixer used for sounds
-        pygame.mixer.init()
+        # Set when every row has to be drawn again, e.g. after a palette change
+        self.redraw = False
 
-        sound_file_path = os.path.join(os.path.dirname(__file__), 'sound/beep.wav')
-        self.beep_sound = pygame.mixer.Sound(sound_file_path)
+    def initialize(self):
+        # Only the display is loaded here, the mixer and the beep sound
+        # wait for the first beep
+        pygame.display.init()
 
         self.display = pygame.display.set_mode((self.screen_width, self.screen_height))
         self.display.fill(self.background_color)
 
-    def update_screen(self):
-        for col in range(self.HEIGHT):
-            for row in range(self.WIDTH):
-                bit = self.pixels[col][row]
-                color = None
-                if bit == 1:
-                    color = self.active_color
-                else:
-                    color = self.background_color
-
-                self.draw_pixel(row, col, color=color)
-        pygame.display.flip()
+    def update_screen(self, framebuffer):
+        # Only redraw the rows changed since the last update
+        rows = framebuffer.take_dirty_rows()
+        if self.redraw:
+            rows = range(self.HEIGHT)
+            self.redraw = False
+        if not rows:
+            return
+
+        framebuffer_rows = framebuffer.rows
+        rects = []
+        for col in rows:
+            row_rect = pygame.Rect(0, col * self.scale, self.screen_width, self.scale)
+            self.display.fill(self.background_color, row_rect)
+
+            # Only visit the pixels that are on
+            bits = framebuffer_rows[col]
+            while bits:
+                top = bits.bit_length() - 1
+                self.draw_pixel(self.WIDTH - 1 - top, col, color=self.active_color)
+                bits ^= 1 << top
+            rects.append(row_rect)
+        pygame.display.update(rects)
 
     def draw_pixel(self, x, y, color=None):
         if color is None:
@@ -56,30 +69,99 @@ class Screen:
         block_size = self.scale - self.scale/10000
         pygame.draw.rect(self.display, color, (x * self.scale, y * self.scale, block_size, block_size))
 
-    def draw_sprite(self, sprite, x, y):
-
-        n = len(sprite)
-        collision = 0
-        for j in range(n):
-            byte = sprite[j]
-            byte_string = '{0:08b}'.format(byte)
-            offset_y = y + j
-            offset_x = x
-            for i in range(8):
-                pixel = int(byte_string[i])
-                location_x = (offset_x + i) % self.WIDTH
-                location_y = offset_y % self.HEIGHT
-                old_pixel = self.pixels[location_y][location_x]
-                new_pixel = pixel ^ old_pixel
-                self.pixels[location_y][location_x] = new_pixel
-                if pixel == 1 and old_pixel == 1:
-                    collision = 1
-        return collision
-
-    def clear_screen(self):
-        for i in range(self.HEIGHT):
-            for j in range(self.WIDTH):
-                self.pixels[i][j] = 0
+    def set_palette(self, background_color, active_color):
+        self.background_color = background_color
+        self.active_color = active_color
+        self.redraw = True
 
     def play_beep_sound(self):
+        if self.beep_sound is None:
+            pygame.mixer.init()
+            sound_file_path = os.path.join(os.path.dirname(__file__), 'sound/beep.wav')
+            self.beep_sound = pygame.mixer.Sound(sound_file_path)
         self.beep_sound.play()
+
+
+class NumpyScreen(Screen):
+    # Keeps the frame as a NumPy array of display colors and pushes it with
+    # one surfarray blit and one scaled blit, so the cost of a frame does
+    # not grow with the number of lit pixels.
+
+    def __init__(self, scale=None):
+        super().__init__(scale)
+
+        # Only needed by this renderer
+        import numpy
+        self.numpy = numpy
+
+        # Pixel value -> display color, mapped once the window exists
+        self.palette = None
+        self.frame = None
+
+    def initialize(self):
+        super().initialize()
+        self.frame = pygame.Surface((self.WIDTH, self.HEIGHT), 0, self.display)
+
+    def set_palette(self, background_color, active_color):
+        super().set_palette(background_color, active_color)
+        self.palette = None
+
+    def update_screen(self, framebuffer):
+        rows = framebuffer.take_dirty_rows()
+        if not rows and not self.redraw:
+            return
+        self.redraw = False
+
+        numpy = self.numpy
+        if self.palette is None:
+            colors = [self.display.map_rgb(self.background_color), self.display.map_rgb(self.active_color)]
+            self.palette = numpy.array(colors, dtype=numpy.uint32)
+
+        packed = numpy.frombuffer(framebuffer.to_bytes(), dtype=numpy.uint8).reshape(self.HEIGHT, self.WIDTH // 8)
+        pixels = numpy.unpackbits(packed, axis=1)
+
+        # surfarray is indexed [x][y]
+        pygame.surfarray.blit_array(self.frame, self.palette[pixels.T])
+        pygame.transform.scale(self.frame, (self.screen_width, self.screen_height), self.display)
+        pygame.display.flip()
+
+
+class PygameFrontend(Frontend):
+    # Window, keyboard and beep sound through pygame
+
+    # Renderer name -> Screen class
+    RENDERERS = {
+        "rect": Screen,
+        "numpy": NumpyScreen,
+    }
+
+    def __init__(self, renderer=None, scale=None):
+        self.renderer = constants.RENDERER if renderer is None else renderer
+        self.scale = scale
+        self.screen = None
+
+    def initialize(self):
+        self.screen = self.RENDERERS[self.renderer](self.scale)
+        self.screen.initialize()
+
+    def poll_keys(self, keys):
+        events = pygame.event.get()
+        for event in events:
+            if event.type == pygame.QUIT:
+                sys.exit()
+            elif event.type == pygame.KEYDOWN:
+                if event.key in Keys.key_dict:
+                    keys[Keys.key_dict[event.key]] = True
+                    if constants.DEBUG_PRINT:
+                        print(f"You Pressed : {chr(event.key)}")
+            elif event.type == pygame.KEYUP:
+                if event.key in Keys.key_dict:
+                    keys[Keys.key_dict[event.key]] = False
+                    if constants.DEBUG_PRINT:
+                        print(f"You Released : {chr(event.key)}")
+
+    def present(self, framebuffer):
+        self.screen.update_screen(framebuffer)
+
+    def play_beep(self):
+        self.screen.play_beep_sound()
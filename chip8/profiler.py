@@ -0,0 +1,200 @@
+import argparse
+import json
+import sys
+import time
+
+from chip8.chip8 import Chip8, Idle
+from chip8.decoder import Decoder, OpCodes
+from chip8.frontend import Frontend
+
+
+class Profiler:
+    # Counts executed instructions per op code, per PC and per call stack,
+    # times DXYN sprite drawing and the frontend's present(), and counts the
+    # frames presented.
+    # While attached the machine runs its instructions through
+    # Profiler.execute, an interpreter loop with the counters added, so
+    # Chip8 pays nothing for profiling when no profiler is attached.
+    # Call stacks follow 2NNN and 00EE, and are written as collapsed
+    # stacks that flamegraph.pl and speedscope read.
+    #
+    # Usage:
+    #     profiler = Profiler(chip8)
+    #     chip8.run(100000)
+    #     profiler.write_json("profile.json")
+    #     profiler.write_collapsed("profile.folded")
+
+    def __init__(self, chip8):
+        self.chip8 = chip8
+
+        # Op code -> executions, grouped into OpCodes in report()
+        self.op_codes = {}
+        self.pcs = {}
+
+        # Call stack, entry addresses of the subroutines -> PC -> executions
+        self.stacks = {}
+        self.stack = ()
+
+        self.draw_calls = 0
+        self.draw_time = 0
+        self.present_calls = 0
+        self.present_time = 0
+        self.idle_cycles = 0
+
+        chip8.profiler = self
+        self.frontend = ProfilingFrontend(self, chip8.frontend)
+        chip8.frontend = self.frontend
+
+    def detach(self):
+        self.chip8.profiler = None
+        self.frontend.profiler = None
+        if self.chip8.frontend is self.frontend:
+            self.chip8.frontend = self.frontend.frontend
+
+    def execute(self, cycles):
+        chip8 = self.chip8
+        memory = chip8.memory
+        dispatch = chip8._dispatch
+        op_codes = self.op_codes
+        pcs = self.stacks.setdefault(self.stack, {})
+        draw = Chip8._op_dxyn_drw
+        clock = time.perf_counter_ns
+        while cycles > 0:
+            pc = chip8.PC
+            op_code = (memory[pc] << 8) | memory[pc + 1]
+            entry = dispatch.get(op_code)
+            if entry is None:
+                entry = chip8.predecode(op_code)
+            handler, x, y, kk, nnn, n = entry
+
+            op_codes[op_code] = op_codes.get(op_code, 0) + 1
+            pcs[pc] = pcs.get(pc, 0) + 1
+            try:
+                if handler is draw:
+                    start = clock()
+                    handler(chip8, x, y, kk, nnn, n)
+                    self.draw_time += clock() - start
+                    self.draw_calls += 1
+                else:
+                    handler(chip8, x, y, kk, nnn, n)
+            except Idle as idle:
+                rest = chip8.skip_idle(idle, cycles - 1)
+                self.idle_cycles += cycles - 1 - rest
+                cycles = rest
+                continue
+            chip8.PC += 2
+            cycles -= 1
+
+            if op_code & 0xF0FF in Chip8.WRITES_MEMORY:
+                chip8.memory_written(op_code)
+            elif op_code & 0xF000 == 0x2000:
+                self.stack = self.stack[:chip8.stack_pointer] + (nnn,)
+                pcs = self.stacks.setdefault(self.stack, {})
+            elif op_code == 0x00EE:
+                self.stack = self.stack[:chip8.stack_pointer + 1]
+                pcs = self.stacks.setdefault(self.stack, {})
+
+    def report(self):
+        opcodes = {}
+        for op_code, count in self.op_codes.items():
+            instruction = Decoder.decode(op_code)
+            name = "invalid" if instruction == OpCodes._NO_OPCODE else instruction.value
+            opcodes[name] = opcodes.get(name, 0) + count
+
+        pcs = {}
+        for stack_pcs in self.stacks.values():
+            for pc, count in stack_pcs.items():
+                pcs[pc] = pcs.get(pc, 0) + count
+
+        return {
+            "instructions": sum(self.op_codes.values()),
+            "idle_cycles": self.idle_cycles,
+            "frames": self.chip8.frame_count,
+            "frames_presented": self.present_calls,
+            "opcodes": dict(sorted(opcodes.items(), key=lambda item: -item[1])),
+            "pcs": {f"{pc:#05x}": count for pc, count in sorted(pcs.items(), key=lambda item: -item[1])},
+            "draw_sprite": {"calls": self.draw_calls, "seconds": self.draw_time / 1e9},
+            "update_screen": {"calls": self.present_calls, "seconds": self.present_time / 1e9},
+        }
+
+    def write_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+    def collapsed(self):
+        # "main;sub_2a4;Dxyn_2b0 count" lines, one per stack and PC
+        memory = self.chip8.memory
+        lines = []
+        for stack, stack_pcs in self.stacks.items():
+            frames = ["main"] + [f"sub_{address:03x}" for address in stack]
+            for pc, count in sorted(stack_pcs.items()):
+                instruction = Decoder.decode((memory[pc] << 8) | memory[pc + 1])
+                name = "invalid" if instruction == OpCodes._NO_OPCODE else instruction.value
+                lines.append(f"{';'.join(frames)};{name}_{pc:03x} {count}")
+        return lines
+
+    def write_collapsed(self, path):
+        with open(path, "w") as f:
+            for line in self.collapsed():
+                f.write(line + "\n")
+
+
+class ProfilingFrontend(Frontend):
+    # Wraps the machine's frontend while a Profiler is attached,
+    # and times its present()
+
+    def __init__(self, profiler, frontend):
+        self.profiler = profiler
+        self.frontend = frontend
+        self.skippable = frontend.skippable
+
+    def initialize(self):
+        self.frontend.initialize()
+
+    def poll_input(self, chip8):
+        self.frontend.poll_input(chip8)
+
+    def poll_keys(self, keys):
+        self.frontend.poll_keys(keys)
+
+    def present(self, framebuffer):
+        profiler = self.profiler
+        if profiler is None:
+            # Detached while something else wrapped this frontend
+            self.frontend.present(framebuffer)
+            return
+        start = time.perf_counter_ns()
+        self.frontend.present(framebuffer)
+        profiler.present_time += time.perf_counter_ns() - start
+        profiler.present_calls += 1
+
+    def play_beep(self):
+        self.frontend.play_beep()
+
+
+if __name__ == "__main__":
+    from chip8.frontend import ScriptedFrontend
+
+    parser = argparse.ArgumentParser(description="Profile a ROM headless, with scripted key presses")
+    parser.add_argument("rom")
+    parser.add_argument("--cycles", type=int, default=100000)
+    parser.add_argument("--json", help="write the report to this file instead of stdout")
+    parser.add_argument("--collapsed", help="write collapsed stacks for flamegraph.pl to this file")
+    args = parser.parse_args()
+
+    machine = Chip8()
+    machine.frontend = ScriptedFrontend(ScriptedFrontend.round_robin(args.cycles // machine.cycles_per_frame + 1))
+    machine.load_game(args.rom)
+    machine.initialize()
+    rom_profiler = Profiler(machine)
+    try:
+        machine.run(args.cycles)
+    except (IndexError, ValueError) as error:
+        print(f"Stopped after {machine.cycle_count} cycles: {error}", file=sys.stderr)
+
+    if args.json:
+        rom_profiler.write_json(args.json)
+    else:
+        print(json.dumps(rom_profiler.report(), indent=2))
+    if args.collapsed:
+        rom_profiler.write_collapsed(args.collapsed)
@@ -0,0 +1,120 @@
+import argparse
+import hashlib
+import json
+import sys
+
+from chip8.chip8 import Chip8
+from chip8.engines import ENGINES, attach
+from chip8.frontend import Frontend
+
+
+def state_hash(chip8):
+    # SHA-256 of the whole machine state, screen included
+    return hashlib.sha256(chip8.save_state()).hexdigest()
+
+
+class RecordingFrontend(Frontend):
+    # Wraps another frontend and records every key change it makes
+    # as (cycle, key, pressed), the cycle being chip8.cycle_count when
+    # the keys were polled at the end of a frame.
+    #
+    # Usage:
+    #     recorder = RecordingFrontend(PygameFrontend())
+    #     chip8 = Chip8(frontend=recorder, seed=1234)
+    #     ...
+    #     recorder.save("session.json", chip8, "games/pong.ch8")
+
+    def __init__(self, frontend):
+        self.frontend = frontend
+        self.events = []
+        self.keys = [False] * 16
+
+    def initialize(self):
+        self.frontend.initialize()
+
+    def poll_input(self, chip8):
+        try:
+            self.frontend.poll_input(chip8)
+        finally:
+            # Also when the window was closed half way through the events
+            self.record_keys(chip8)
+
+    def record_keys(self, chip8):
+        # Record the keys of the machine that changed since the last call
+        for key in range(16):
+            if chip8.keys[key] != self.keys[key]:
+                self.keys[key] = chip8.keys[key]
+                self.events.append((chip8.cycle_count, key, chip8.keys[key]))
+
+    def present(self, framebuffer):
+        self.frontend.present(framebuffer)
+
+    def play_beep(self):
+        self.frontend.play_beep()
+
+    def save(self, path, chip8, rom_path):
+        with open(rom_path, "rb") as f:
+            rom = f.read()
+        recording = {
+            "rom": rom_path,
+            "rom_sha256": hashlib.sha256(rom).hexdigest(),
+            "seed": chip8.seed,
+            "cycles_per_frame": chip8.cycles_per_frame,
+            "cycles": chip8.cycle_count,
+            "events": self.events,
+            "state_sha256": state_hash(chip8),
+        }
+        with open(path, "w") as f:
+            json.dump(recording, f)
+
+
+class ReplayFrontend(Frontend):
+    # Headless, applies recorded (cycle, key, pressed) events
+    # at the end of the frame they were recorded in
+    skippable = True
+
+    def __init__(self, events):
+        self.events = events
+        self.position = 0
+
+    def poll_input(self, chip8):
+        events = self.events
+        while self.position < len(events) and events[self.position][0] <= chip8.cycle_count:
+            cycle, key, pressed = events[self.position]
+            chip8.keys[key] = pressed
+            self.position += 1
+
+
+def replay(recording, rom_path=None, engine="interpreter"):
+    # Run a recording headless as fast as possible,
+    # returns the machine in its final state
+    rom_path = rom_path or recording["rom"]
+    with open(rom_path, "rb") as f:
+        rom = f.read()
+    if hashlib.sha256(rom).hexdigest() != recording["rom_sha256"]:
+        raise ValueError(f"{rom_path} is not the ROM this session was recorded with")
+
+    chip8 = Chip8(frontend=ReplayFrontend(recording["events"]), seed=recording["seed"])
+    chip8.cycles_per_frame = recording["cycles_per_frame"]
+    chip8.load_rom(rom, name=rom_path)
+    chip8.initialize()
+    attach(chip8, engine)
+    chip8.run(recording["cycles"])
+    return chip8
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a recorded session headless and check its final state")
+    parser.add_argument("recording")
+    parser.add_argument("--rom", help="ROM file, the path stored in the recording by default")
+    parser.add_argument("--engine", choices=ENGINES, default="interpreter")
+    args = parser.parse_args()
+
+    with open(args.recording) as recording_file:
+        session = json.load(recording_file)
+    machine = replay(session, args.rom, args.engine)
+    digest = state_hash(machine)
+    print(f"{machine.cycle_count} cycles, {machine.frame_count} frames, state {digest}")
+    if digest != session["state_sha256"]:
+        print(f"State differs from the recorded {session['state_sha256']}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,84 @@
+import zlib
+from collections import deque
+
+import chip8.constants as constants
+
+
+class Rewind:
+    # Keeps the machine state of the last `seconds` of frames so a game can
+    # be stepped back without replaying it from the start.
+    # Every keyframe_interval frames a full save state is kept as a
+    # keyframe, the frames in between only store the XOR of their state
+    # with that keyframe, zlib compressed. Mostly identical states XOR to
+    # mostly zeros, so a frame usually takes a few dozen bytes.
+    # Old frames fall off the ring buffer, and a keyframe is freed with the
+    # last frame that refers to it.
+    #
+    # Usage:
+    #     rewind = Rewind(chip8, seconds=10)
+    #     chip8.run(10000)
+    #     rewind.rewind(frames=60)
+
+    def __init__(self, chip8, seconds=10, keyframe_interval=60):
+        self.chip8 = chip8
+        self.keyframe_interval = keyframe_interval
+
+        # (keyframe state, compressed XOR delta or None for the keyframe itself)
+        self.frames = deque(maxlen=max(1, int(seconds * constants.TIMER_SPEED)))
+        self.keyframe = None
+        self.since_keyframe = 0
+
+        chip8.frame_hooks.append(self.record)
+
+    def detach(self):
+        self.chip8.frame_hooks.remove(self.record)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def record(self, chip8):
+        state = chip8.save_state()
+        if self.keyframe is None or self.since_keyframe >= self.keyframe_interval:
+            self.keyframe = state
+            self.since_keyframe = 0
+            self.frames.append((state, None))
+        else:
+            self.frames.append((self.keyframe, zlib.compress(self.xor(self.keyframe, state), 1)))
+        self.since_keyframe += 1
+
+    def rewind(self, frames=1):
+        # Go back `frames` frames, as far as the buffer reaches,
+        # and return how many frames were actually rewound
+        frames = min(frames, len(self.frames) - 1)
+        if frames <= 0:
+            return 0
+        for _ in range(frames):
+            self.frames.pop()
+
+        keyframe, delta = self.frames[-1]
+        if delta is None:
+            state = keyframe
+        else:
+            state = self.xor(keyframe, zlib.decompress(delta))
+        self.chip8.load_state(state)
+
+        # Recording goes on from the restored frame, against its keyframe
+        self.keyframe = keyframe
+        self.since_keyframe = 0
+        for previous_keyframe, _ in reversed(self.frames):
+            if previous_keyframe is not keyframe:
+                break
+            self.since_keyframe += 1
+        return frames
+
+    def memory_usage(self):
+        # Bytes held by the stored keyframes and deltas
+        keyframes = {id(keyframe): len(keyframe) for keyframe, _ in self.frames}
+        deltas = sum(len(delta) for _, delta in self.frames if delta is not None)
+        return sum(keyframes.values()) + deltas
+
+    @staticmethod
+    def xor(one, two):
+        # Both states have the same length
+        size = len(one)
+        return (int.from_bytes(one, "little") ^ int.from_bytes(two, "little")).to_bytes(size, "little")
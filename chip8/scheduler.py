@@ -0,0 +1,228 @@
+import threading
+import time
+
+import chip8.constants as constants
+from chip8.framebuffer import FrameBuffer
+from chip8.frontend import Frontend
+
+
+class FramePacer:
+    # Paces a loop to one pass every frame_time seconds. A pass that ends
+    # after its deadline counts as late, and one more than a whole frame
+    # behind starts over from now instead of trying to catch up.
+
+    def __init__(self, frame_time=None):
+        self.frame_time = 1 / constants.TIMER_SPEED if frame_time is None else frame_time
+        self.late_ticks = 0
+        self.start()
+
+    def start(self):
+        self.deadline = time.perf_counter()
+
+    def delay(self):
+        # Seconds left until the next frame is due, 0 when it is late
+        self.deadline += self.frame_time
+        delay = self.deadline - time.perf_counter()
+        if delay > 0:
+            return delay
+        self.late_ticks += 1
+        if delay < -self.frame_time:
+            self.deadline = time.perf_counter()
+        return 0
+
+    def wait(self):
+        delay = self.delay()
+        if delay:
+            time.sleep(delay)
+
+
+class Scheduler:
+    # Runs a Chip8 one frame at a time.
+    # Each frame executes cycles_per_frame instructions, ticks the timers
+    # once and presents the screen at most once, so the same ROM runs at
+    # CLOCK_SPEED instructions and TIMER_SPEED frames per second.
+    # Only one frame out of every frame_skip + 1 is presented, and in turbo
+    # mode frames are not paced at all.
+
+    def __init__(self, chip8, turbo=None, frame_skip=None):
+        self.chip8 = chip8
+        self.turbo = constants.TURBO if turbo is None else turbo
+        self.frame_skip = constants.FRAME_SKIP if frame_skip is None else frame_skip
+        self.pacer = FramePacer()
+
+        self.frames = 0
+        self.presented = 0
+
+    def run(self, frames=None):
+        # Run forever, or for the given number of frames
+        chip8 = self.chip8
+        self.pacer.start()
+        while frames is None or self.frames < frames:
+            chip8.run_frame()
+            self.frames += 1
+
+            if self.frames % (self.frame_skip + 1) == 0 and chip8.screen.dirty_rows:
+                chip8.frontend.present(chip8.screen)
+                self.presented += 1
+
+            if not self.turbo:
+                self.pacer.wait()
+
+
+class ThreadedScheduler:
+    # Emulates in a thread of its own while the calling thread presents
+    # frames and polls input, so a slow display update never holds up
+    # the machine.
+    # At the end of every frame the emulation thread publishes the screen
+    # rows as one immutable tuple, replacing `latest` in a single
+    # assignment, and the presenting thread draws the newest frame it finds
+    # into a FrameBuffer of its own. Frames replaced before they were
+    # presented are counted as dropped.
+    # Keys polled by the presenting thread reach the machine when its
+    # frame ends, and beeps are played by the presenting thread too,
+    # since most display and audio libraries want a single thread.
+    # A recording frontend (replay.RecordingFrontend) records the keys in
+    # the emulation thread, at the cycle the machine actually got them.
+
+    def __init__(self, chip8, turbo=None):
+        self.chip8 = chip8
+        self.frontend = chip8.frontend
+
+        # The frontend the presenting thread polls, the one a recording
+        # frontend wraps
+        self.recorder = None
+        self.input_frontend = self.frontend
+        if hasattr(self.frontend, "record_keys"):
+            self.recorder = self.frontend
+            self.input_frontend = self.frontend.frontend
+        self.turbo = constants.TURBO if turbo is None else turbo
+        self.pacer = FramePacer()
+
+        # (frame number, screen rows) of the newest complete frame
+        self.latest = (0, tuple(chip8.screen.rows))
+        self.frame_ready = threading.Event()
+        self.running = False
+        self.error = None
+
+        # What the presenting thread shows and polls
+        self.screen = FrameBuffer()
+        self.screen.rows = list(self.latest[1])
+        self.keys = [False] * 16
+        self.beeps = 0
+
+        self.frames = 0
+        self.presented = 0
+        self.dropped = 0
+
+        # Time between presented frames: count, sum, sum of squares, max
+        self.intervals = 0
+        self.interval_total = 0
+        self.interval_squares = 0
+        self.interval_max = 0
+
+    def run(self, frames=None):
+        # Run forever, or for the given number of frames
+        chip8 = self.chip8
+        chip8.frontend = EmulationFrontend(self)
+        self.running = True
+        thread = threading.Thread(target=self.emulate, args=(frames,), daemon=True)
+        thread.start()
+
+        shown = 0
+        played = 0
+        last_present = None
+        try:
+            while thread.is_alive():
+                self.frame_ready.wait(self.pacer.frame_time)
+                self.frame_ready.clear()
+                self.input_frontend.poll_keys(self.keys)
+                if played != self.beeps:
+                    played = self.beeps
+                    self.frontend.play_beep()
+
+                number, rows = self.latest
+                if number == shown:
+                    continue
+                self.dropped += number - shown - 1
+                shown = number
+                self.present(rows)
+
+                now = time.perf_counter()
+                if last_present is not None:
+                    interval = now - last_present
+                    self.intervals += 1
+                    self.interval_total += interval
+                    self.interval_squares += interval * interval
+                    self.interval_max = max(self.interval_max, interval)
+                last_present = now
+        finally:
+            self.running = False
+            thread.join()
+            chip8.frontend = self.frontend
+
+        if self.error is not None:
+            raise self.error
+        number, rows = self.latest
+        if number != shown:
+            self.present(rows)
+
+    def present(self, rows):
+        # Only the rows that differ from what is on screen are redrawn
+        screen = self.screen
+        for row in range(FrameBuffer.HEIGHT):
+            if screen.rows[row] != rows[row]:
+                screen.rows[row] = rows[row]
+                screen.dirty_rows.add(row)
+        if screen.dirty_rows:
+            self.frontend.present(screen)
+        self.presented += 1
+
+    def emulate(self, frames):
+        chip8 = self.chip8
+        self.pacer.start()
+        try:
+            while self.running and (frames is None or self.frames < frames):
+                chip8.run_frame()
+                chip8.screen.dirty_rows.clear()
+                self.frames += 1
+                self.latest = (self.frames, tuple(chip8.screen.rows))
+                self.frame_ready.set()
+
+                if not self.turbo:
+                    self.pacer.wait()
+        except BaseException as error:
+            # Raised again by run() in the presenting thread
+            self.error = error
+        finally:
+            self.frame_ready.set()
+
+    def stats(self):
+        # Frame counts, and the mean, jitter and worst time between
+        # presented frames in seconds
+        mean = self.interval_total / self.intervals if self.intervals else 0
+        variance = self.interval_squares / self.intervals - mean * mean if self.intervals else 0
+        return {
+            "frames": self.frames,
+            "presented": self.presented,
+            "dropped": self.dropped,
+            "late_frames": self.pacer.late_ticks,
+            "mean_interval": mean,
+            "jitter": max(0, variance) ** 0.5,
+            "max_interval": self.interval_max,
+        }
+
+
+class EmulationFrontend(Frontend):
+    # The machine's frontend while a ThreadedScheduler runs it: input and
+    # beeps are handed over to the presenting thread
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+
+    def poll_input(self, chip8):
+        chip8.keys[:] = self.scheduler.keys
+        if self.scheduler.recorder is not None:
+            self.scheduler.recorder.record_keys(chip8)
+
+    def play_beep(self):
+        self.scheduler.beeps += 1
@@ -0,0 +1,260 @@
+import argparse
+import asyncio
+import os
+import struct
+import sys
+
+import chip8.constants as constants
+from chip8.chip8 import Chip8
+from chip8.framebuffer import FrameBuffer
+from chip8.frontend import HeadlessFrontend
+from chip8.scheduler import FramePacer
+
+# Messages from the server, all numbers big-endian:
+#   K  frame number, then the 256 bytes of FrameBuffer.to_bytes()
+#   D  frame number, a 32-bit mask of the rows that changed, then for every
+#      row in the mask, top to bottom, 8 bytes XORed with the row last sent
+#   B  the sound timer ran out, play a beep
+# Messages from a client, after a first line "<game> [<session>]\n":
+#   2 bytes, key 0-F and 1 when pressed or 0 when released
+KEYFRAME = struct.Struct(">cI")
+DELTA = struct.Struct(">cII")
+ROW = struct.Struct(">Q")
+KEY = struct.Struct(">BB")
+BEEP = b"B"
+
+# A keyframe every second, so a client that missed frames resyncs quickly
+KEYFRAME_INTERVAL = constants.TIMER_SPEED
+
+# Clients with more than this many bytes not yet sent skip frames until they catch up
+MAX_BUFFERED = 64 * 1024
+
+DEFAULT_PORT = 8765
+
+
+class ServerFrontend(HeadlessFrontend):
+    # Keys come from the session's clients, beeps go back to them
+
+    def __init__(self, session):
+        self.session = session
+
+    def poll_input(self, chip8):
+        chip8.keys[:] = self.session.keys
+
+    def play_beep(self):
+        for client in self.session.clients:
+            client.writer.write(BEEP)
+
+
+class Session:
+    # One headless machine and the clients watching it
+
+    def __init__(self, name, rom, seed=None):
+        self.name = name
+        self.keys = [False] * 16
+        self.clients = []
+        self.chip8 = Chip8(frontend=ServerFrontend(self), seed=seed)
+        self.chip8.load_rom(rom, name=name)
+        self.chip8.initialize()
+
+
+class Client:
+    def __init__(self, writer):
+        self.writer = writer
+
+        # Rows of the last frame sent, deltas are taken against them
+        self.rows = None
+        self.since_keyframe = 0
+
+    def send(self, frame_number, rows):
+        # Queue the changes since the last frame sent, or a keyframe when due.
+        # A slow client is skipped, it gets the combined changes once its
+        # buffer drains.
+        writer = self.writer
+        if writer.transport.get_write_buffer_size() > MAX_BUFFERED:
+            return
+        if self.rows is None or self.since_keyframe >= KEYFRAME_INTERVAL:
+            writer.write(KEYFRAME.pack(b"K", frame_number) + b"".join(row.to_bytes(8, "big") for row in rows))
+            self.rows = list(rows)
+            self.since_keyframe = 0
+            return
+
+        self.since_keyframe += 1
+        sent = self.rows
+        mask = 0
+        changes = []
+        for y in range(FrameBuffer.HEIGHT):
+            if rows[y] != sent[y]:
+                mask |= 1 << y
+                changes.append(ROW.pack(rows[y] ^ sent[y]))
+                sent[y] = rows[y]
+        if mask:
+            writer.write(DELTA.pack(b"D", frame_number, mask) + b"".join(changes))
+
+
+class Server:
+    # Hosts any number of sessions in one asyncio event loop, each a
+    # headless Chip8 that several TCP clients can watch and drive.
+    # A single task runs one frame of every session per tick, and every
+    # client receives only the rows that changed since the last frame it
+    # was sent, with a keyframe every KEYFRAME_INTERVAL frames.
+    # A session is created by its first client and dropped with its last.
+    #
+    # Usage:
+    #     server = Server({"pong": rom_bytes})
+    #     asyncio.run(server.serve("127.0.0.1", 8765))
+
+    def __init__(self, roms, seed=None):
+        # Game name -> ROM bytes
+        self.roms = roms
+        self.seed = seed
+        self.sessions = {}
+        self.pacer = FramePacer()
+
+    async def serve(self, host="127.0.0.1", port=DEFAULT_PORT):
+        server = await asyncio.start_server(self.handle_client, host, port)
+        async with server:
+            await self.tick()
+
+    async def tick(self):
+        self.pacer.start()
+        while True:
+            for session in list(self.sessions.values()):
+                self.run_frame(session)
+            await asyncio.sleep(self.pacer.delay())
+
+    def run_frame(self, session):
+        chip8 = session.chip8
+        try:
+            chip8.run_frame()
+        except (IndexError, ValueError) as error:
+            # A crashed game ends its session, not the server
+            print(f"Session {session.name} stopped: {error}", file=sys.stderr)
+            for client in session.clients:
+                client.writer.close()
+            self.sessions.pop(session.name, None)
+            return
+
+        screen = chip8.screen
+        changed = bool(screen.dirty_rows)
+        screen.dirty_rows.clear()
+        for client in session.clients:
+            # A client skipped while slow is behind even when nothing
+            # changed this frame, it catches up as soon as it drains
+            if changed or client.rows != screen.rows or client.since_keyframe >= KEYFRAME_INTERVAL:
+                client.send(chip8.frame_count, screen.rows)
+            else:
+                client.since_keyframe += 1
+
+    async def handle_client(self, reader, writer):
+        try:
+            hello = (await reader.readline()).decode(errors="replace").split()
+        except ConnectionError:
+            writer.close()
+            return
+        if not hello or hello[0] not in self.roms:
+            writer.close()
+            return
+        game = hello[0]
+        # Without a session name every connection plays a game of its own
+        name = f"{game}/{hello[1] if len(hello) > 1 else id(writer)}"
+
+        session = self.sessions.get(name)
+        if session is None:
+            session = Session(name, self.roms[game], self.seed)
+            self.sessions[name] = session
+        client = Client(writer)
+        session.clients.append(client)
+
+        try:
+            while True:
+                message = await reader.readexactly(KEY.size)
+                key, pressed = KEY.unpack(message)
+                if key < 16:
+                    session.keys[key] = bool(pressed)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            session.clients.remove(client)
+            if not session.clients and self.sessions.get(name) is session:
+                del self.sessions[name]
+            writer.close()
+
+
+async def read_message(reader, screen):
+    # Read one message from the server and apply a keyframe or a delta to
+    # screen, returns the kind of the message, b"K", b"D" or BEEP
+    kind = await reader.readexactly(1)
+    if kind == b"K":
+        data = await reader.readexactly(KEYFRAME.size - 1 + FrameBuffer.HEIGHT * 8)
+        screen.load_bytes(data[KEYFRAME.size - 1:])
+    elif kind == b"D":
+        _, frame_number, mask = DELTA.unpack(kind + await reader.readexactly(DELTA.size - 1))
+        data = await reader.readexactly(bin(mask).count("1") * ROW.size)
+        offset = 0
+        for y in range(FrameBuffer.HEIGHT):
+            if mask >> y & 1:
+                screen.rows[y] ^= ROW.unpack_from(data, offset)[0]
+                screen.dirty_rows.add(y)
+                offset += ROW.size
+    elif kind != BEEP:
+        raise ValueError(f"Unknown message {kind!r}")
+    return kind
+
+
+async def watch(host, port, game, session=None, frontend=None):
+    # Show a session in a window and send it the keys pressed there
+    if frontend is None:
+        from chip8.graphics import PygameFrontend
+        frontend = PygameFrontend()
+    frontend.initialize()
+
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f"{game} {session or ''}\n".encode())
+    screen = FrameBuffer()
+    keys = [False] * 16
+    sent_keys = list(keys)
+
+    async def send_keys():
+        while True:
+            frontend.poll_keys(keys)
+            for key in range(16):
+                if keys[key] != sent_keys[key]:
+                    sent_keys[key] = keys[key]
+                    writer.write(KEY.pack(key, keys[key]))
+            await asyncio.sleep(1 / constants.TIMER_SPEED)
+
+    keys_task = asyncio.ensure_future(send_keys())
+    try:
+        while True:
+            if await read_message(reader, screen) == BEEP:
+                frontend.play_beep()
+            else:
+                frontend.present(screen)
+    except asyncio.IncompleteReadError:
+        # The server closed the session
+        pass
+    finally:
+        keys_task.cancel()
+        writer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream headless CHIP-8 sessions to TCP clients, or watch one")
+    parser.add_argument("roms", nargs="*", help="ROMs to serve, a client asks for one by its file name without .ch8")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--seed", type=int, help="seed of every session, random by default")
+    parser.add_argument("--watch", metavar="GAME", help="connect to a server and play GAME in a window")
+    parser.add_argument("--session", help="with --watch, the session to join, shared by everyone using that name")
+    args = parser.parse_args()
+
+    if args.watch:
+        asyncio.run(watch(args.host, args.port, args.watch, args.session))
+    else:
+        games = {}
+        for rom_path in args.roms:
+            with open(rom_path, "rb") as rom_file:
+                games[os.path.splitext(os.path.basename(rom_path))[0]] = rom_file.read()
+        print(f"Serving {', '.join(sorted(games))} on {args.host}:{args.port}", file=sys.stderr)
+        asyncio.run(Server(games, args.seed).serve(args.host, args.port))
@@ -0,0 +1,100 @@
+import struct
+import sys
+
+from chip8.decoder import Decoder
+
+# One record per instruction, the state before it is executed:
+# PC, op code, I, V0 .. VF
+RECORD = struct.Struct("<HHH16B")
+MAGIC = b"CHIP8TR1"
+
+
+class Tracer:
+    # Records the last `size` executed instructions into a ring buffer.
+    # Chip8 only pays for it while chip8.tracer is set.
+    # When a path is given, every record is also streamed to that file
+    # each time the ring buffer fills up, and on close().
+    #
+    # Usage:
+    #     chip8.tracer = Tracer(size=4096, path="trace.bin")
+    #     chip8.run(10000)
+    #     chip8.tracer.close()
+    #     python -m chip8.trace trace.bin
+
+    def __init__(self, size=4096, path=None):
+        self.size = size
+        self.buffer = bytearray(RECORD.size * size)
+
+        # Records written since the start, and since the last flush
+        self.count = 0
+        self.flushed = 0
+
+        self.file = None
+        if path is not None:
+            self.file = open(path, "wb")
+            self.file.write(MAGIC)
+
+    def record(self, pc, op_code, i, v):
+        RECORD.pack_into(self.buffer, (self.count % self.size) * RECORD.size, pc, op_code, i & 0xFFFF, *v)
+        self.count += 1
+        if self.file is not None and self.count - self.flushed == self.size:
+            self.flush()
+
+    def flush(self):
+        # Write the records not streamed yet
+        if self.file is None:
+            return
+        for start, end in self.ring_ranges(self.count - self.flushed):
+            self.file.write(self.buffer[start * RECORD.size:end * RECORD.size])
+        self.flushed = self.count
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+    def ring_ranges(self, count):
+        # Slices of the ring buffer holding the last `count` records, oldest first
+        count = min(count, self.count, self.size)
+        end = self.count % self.size
+        start = end - count
+        if start >= 0:
+            return [(start, end)] if count else []
+        return [(self.size + start, self.size), (0, end)]
+
+    def records(self):
+        # The records still in the ring buffer, oldest first
+        result = []
+        for start, end in self.ring_ranges(self.size):
+            for index in range(start, end):
+                result.append(RECORD.unpack_from(self.buffer, index * RECORD.size))
+        return result
+
+    def dump(self, path):
+        # Save the ring buffer to a trace file
+        with open(path, "wb") as f:
+            f.write(MAGIC)
+            for start, end in self.ring_ranges(self.size):
+                f.write(self.buffer[start * RECORD.size:end * RECORD.size])
+
+
+def read_trace(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a trace file")
+    return list(RECORD.iter_unpack(data[len(MAGIC):]))
+
+
+def format_record(record):
+    pc, op_code, i = record[:3]
+    v = record[3:]
+    name = Decoder.mnemonic(op_code)
+    registers = " ".join(f"{value:02x}" for value in v)
+    return f"{pc:#05x}  {op_code:04x}  {name:<12}  I={i:#05x}  V={registers}"
+
+
+if __name__ == "__main__":
+    for trace_record in read_trace(sys.argv[1]):
+        print(format_record(trace_record))
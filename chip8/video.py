@@ -0,0 +1,246 @@
+import argparse
+import struct
+import sys
+import zlib
+
+import chip8.constants as constants
+from chip8.framebuffer import FrameBuffer
+
+# A video file is MAGIC followed by one zlib stream holding:
+#   HEADER      frames per second, then the 256 bytes of the first frame
+#               as FrameBuffer.to_bytes()
+#   RECORD...   frames since the previous record, a 32-bit mask of the rows
+#               that changed, then 8 bytes for every row in the mask, top to
+#               bottom, XORed with that row as it was before
+# Frames where nothing changed have no record of their own, a last record
+# with no rows marks the end of the video.
+MAGIC = b"C8VIDEO1"
+HEADER = struct.Struct(">H")
+RECORD = struct.Struct(">HI")
+ROW = struct.Struct(">Q")
+
+# Uncompressed bytes collected before they are handed to zlib
+CHUNK_SIZE = 64 * 1024
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+class VideoRecorder:
+    # Records the screen at the end of every frame as XOR deltas of the
+    # rows that changed, compressed as it goes. A frame where the screen
+    # did not change costs one list comparison.
+    #
+    # Usage:
+    #     recorder = VideoRecorder(chip8)
+    #     chip8.loop()
+    #     recorder.save("session.c8v")
+    #     export_gif("session.c8v", "session.gif")
+
+    def __init__(self, chip8):
+        self.chip8 = chip8
+        self.rows = list(chip8.screen.rows)
+
+        # Frames recorded so far, the first being the screen right now
+        self.frames = 1
+        self.last_change = 0
+
+        self.compressor = zlib.compressobj(6)
+        self.compressed = []
+        self.pending = bytearray(HEADER.pack(constants.TIMER_SPEED) + chip8.screen.to_bytes())
+
+        chip8.frame_hooks.append(self.record)
+
+    def detach(self):
+        self.chip8.frame_hooks.remove(self.record)
+
+    def record(self, chip8):
+        frame = self.frames
+        self.frames += 1
+        rows = chip8.screen.rows
+        if rows == self.rows:
+            return
+
+        recorded = self.rows
+        mask = 0
+        changes = []
+        for y in range(FrameBuffer.HEIGHT):
+            if rows[y] != recorded[y]:
+                mask |= 1 << y
+                changes.append(ROW.pack(rows[y] ^ recorded[y]))
+                recorded[y] = rows[y]
+
+        self.write_gap(frame - self.last_change, mask)
+        self.pending += b"".join(changes)
+        self.last_change = frame
+
+        if len(self.pending) >= CHUNK_SIZE:
+            self.compressed.append(self.compressor.compress(bytes(self.pending)))
+            self.pending.clear()
+
+    def write_gap(self, gap, mask):
+        while gap > 0xFFFF:
+            # Empty records carry the rest of a very long still
+            self.pending += RECORD.pack(0xFFFF, 0)
+            gap -= 0xFFFF
+        self.pending += RECORD.pack(gap, mask)
+
+    def save(self, path):
+        # Recording goes on afterwards, a later save holds everything
+        compressor = self.compressor.copy()
+        pending = self.pending
+        self.pending = bytearray()
+        self.write_gap(self.frames - self.last_change, 0)
+        end, self.pending = self.pending, pending
+
+        with open(path, "wb") as f:
+            f.write(MAGIC)
+            for chunk in self.compressed:
+                f.write(chunk)
+            f.write(compressor.compress(bytes(pending + end)))
+            f.write(compressor.flush())
+
+
+def read_video(path):
+    # Returns the frame rate and a generator of (first frame, end frame,
+    # rows), one for every different screen in the video
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} is not a CHIP-8 video")
+    data = zlib.decompress(data[len(MAGIC):])
+    (fps,) = HEADER.unpack_from(data)
+    return fps, _screens(data)
+
+
+def _screens(data):
+    offset = HEADER.size
+    rows = [int.from_bytes(data[offset + i:offset + i + 8], "big") for i in range(0, FrameBuffer.HEIGHT * 8, 8)]
+    offset += FrameBuffer.HEIGHT * 8
+
+    frame = 0
+    start = 0
+    while offset < len(data):
+        gap, mask = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        frame += gap
+        if not mask:
+            continue
+        yield start, frame, tuple(rows)
+        for y in range(FrameBuffer.HEIGHT):
+            if mask >> y & 1:
+                rows[y] ^= ROW.unpack_from(data, offset)[0]
+                offset += ROW.size
+        start = frame
+    if frame > start:
+        yield start, frame, tuple(rows)
+
+
+def upscale(rows, scale):
+    # 0 or 1 per pixel as a NumPy array of HEIGHT * scale by WIDTH * scale,
+    # every pixel repeated into a scale by scale block
+    import numpy
+    packed = numpy.frombuffer(b"".join(row.to_bytes(8, "big") for row in rows), dtype=numpy.uint8)
+    pixels = numpy.unpackbits(packed.reshape(FrameBuffer.HEIGHT, FrameBuffer.WIDTH // 8), axis=1)
+    return pixels.repeat(scale, axis=0).repeat(scale, axis=1)
+
+
+def write_png(path, rows, scale=None, background_color=None, active_color=None):
+    # A 1-bit palette PNG of the screen, written with zlib alone
+    import numpy
+    scale = scale or constants.SCREEN_SCALE
+    background_color = background_color or constants.BACKGROUND_COLOR
+    active_color = active_color or constants.ACTIVE_COLOR
+
+    pixels = upscale(rows, scale)
+    height, width = pixels.shape
+    # Every scanline starts with filter type 0
+    scanlines = numpy.packbits(pixels, axis=1)
+    scanlines = numpy.hstack((numpy.zeros((height, 1), dtype=numpy.uint8), scanlines))
+
+    with open(path, "wb") as f:
+        f.write(PNG_SIGNATURE)
+        _write_chunk(f, b"IHDR", struct.pack(">IIBBBBB", width, height, 1, 3, 0, 0, 0))
+        _write_chunk(f, b"PLTE", bytes(background_color) + bytes(active_color))
+        _write_chunk(f, b"IDAT", zlib.compress(scanlines.tobytes(), 6))
+        _write_chunk(f, b"IEND", b"")
+
+
+def _write_chunk(f, kind, data):
+    f.write(struct.pack(">I", len(data)) + kind + data)
+    f.write(struct.pack(">I", zlib.crc32(kind + data)))
+
+
+def export_png(path, pattern, scale=None, every=None):
+    # One PNG per different screen, or with `every` one PNG every that many
+    # frames. pattern is formatted with the frame number, e.g. "shot_{:05d}.png".
+    # Returns the number of files written.
+    fps, screens = read_video(path)
+    written = 0
+    next_frame = 0
+    for start, end, rows in screens:
+        if every is None:
+            write_png(pattern.format(start), rows, scale)
+            written += 1
+            continue
+        while next_frame < end:
+            write_png(pattern.format(next_frame), rows, scale)
+            written += 1
+            next_frame += every
+    return written
+
+
+def export_gif(path, gif_path, scale=None, fps=30, background_color=None, active_color=None):
+    # An animated GIF sampling the video `fps` times a second,
+    # needs Pillow. Returns the number of images in the GIF.
+    from PIL import Image
+    scale = scale or constants.SCREEN_SCALE
+    palette = list(background_color or constants.BACKGROUND_COLOR) + list(active_color or constants.ACTIVE_COLOR)
+
+    video_fps, screens = read_video(path)
+    step = max(1, round(video_fps / fps))
+
+    # (rows, first sample, end sample), samples in a row showing the same
+    # screen become one image
+    images = []
+    sample = 0
+    for start, end, rows in screens:
+        while sample * step < end:
+            if images and images[-1][0] == rows:
+                images[-1][2] = sample + 1
+            else:
+                images.append([rows, sample, sample + 1])
+            sample += 1
+
+    frames = []
+    durations = []
+    for rows, first, end in images:
+        image = Image.fromarray(upscale(rows, scale), "P")
+        image.putpalette(palette)
+        frames.append(image)
+        # Rounded from the start of the video so the delays never drift
+        durations.append(round(end * step * 1000 / video_fps) - round(first * step * 1000 / video_fps))
+
+    frames[0].save(gif_path, save_all=True, append_images=frames[1:], duration=durations, loop=0)
+    return len(frames)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a recorded CHIP-8 video to PNG images or a GIF")
+    parser.add_argument("video", help="recorded with python3 app.py GAME --video VIDEO")
+    parser.add_argument("--png", metavar="PATTERN", help='PNG file names formatted with the frame number, '
+                                                         'e.g. "frames/{:05d}.png"')
+    parser.add_argument("--every", type=int, help="with --png, one image every EVERY frames "
+                                                  "instead of one per different screen")
+    parser.add_argument("--gif", help="write an animated GIF, needs Pillow")
+    parser.add_argument("--fps", type=int, default=30, help="with --gif, images per second")
+    parser.add_argument("--scale", type=int, default=constants.SCREEN_SCALE)
+    args = parser.parse_args()
+
+    if not args.png and not args.gif:
+        parser.error("nothing to export, pass --png or --gif")
+    if args.png:
+        count = export_png(args.video, args.png, args.scale, args.every)
+        print(f"{count} PNG images written", file=sys.stderr)
+    if args.gif:
+        count = export_gif(args.video, args.gif, args.scale, args.fps)
+        print(f"{args.gif} written with {count} images", file=sys.stderr)
@@ -0,0 +1,208 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+
+from chip8.chip8 import Chip8
+from chip8 import engines
+from chip8.frontend import ScriptedFrontend
+
+ROOT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+GAMES_DIRECTORY = os.path.join(ROOT_DIRECTORY, "games")
+GOLDEN_PATH = os.path.join(GAMES_DIRECTORY, "golden.json")
+
+# Settings of a ROM new to the golden file, changed per ROM by editing it
+DEFAULT_CYCLES = 50000
+DEFAULT_EVERY = 60
+DEFAULT_SEED = 0
+
+
+def attach_tracer(chip8):
+    from chip8.trace import Tracer
+    chip8.tracer = Tracer(size=256)
+
+
+def attach_profiler(chip8):
+    from chip8.profiler import Profiler
+    Profiler(chip8)
+
+
+def attach_debugger(chip8):
+    # Armed with checks that never hit, so every instruction runs through
+    # the debugger's loop
+    from chip8.debugger import Debugger
+    debugger = Debugger(chip8)
+    debugger.add_breakpoint(0x000)
+    debugger.add_watchpoint(0x000, 0x050, read=False)
+
+
+# Tools that run the machine's instructions through their own loop
+TOOLS = {
+    "tracer": attach_tracer,
+    "profiler": attach_profiler,
+    "debugger": attach_debugger,
+}
+
+# Every way the machine can execute instructions, they must all agree.
+# "batch" runs the ROM as the only machine of a BatchChip8 instead.
+ENGINES = engines.ENGINES + list(TOOLS) + ["batch"]
+
+# Checked when no --engine is given, batch needs numpy and is slow
+DEFAULT_ENGINES = [engine for engine in ENGINES if engine != "batch"]
+
+# What an engine's check leaves out, shown next to its result
+CAVEATS = {
+    "batch": "screens and halting only, no final state hash",
+}
+
+
+class BatchScriptedFrontend(ScriptedFrontend):
+    # The same script, driving the keys of the first machine of a BatchChip8
+    def poll_input(self, batch):
+        events = self.events
+        while self.position < len(events) and events[self.position][0] <= batch.frame_count:
+            frame, key, pressed = events[self.position]
+            batch.keys[0, key] = pressed
+            self.position += 1
+
+
+def frame_hash(screen):
+    return hashlib.sha256(screen.to_bytes()).hexdigest()[:16]
+
+
+def run_rom(rom_path, settings, engine):
+    # Hashes of the screen every `every` frames, the error that stopped the
+    # machine if any, and a hash of the whole final state
+    if engine == "batch":
+        return run_batch(rom_path, settings)
+    chip8 = Chip8(seed=settings["seed"])
+    frames = settings["cycles"] // chip8.cycles_per_frame + 1
+    chip8.frontend = ScriptedFrontend(ScriptedFrontend.round_robin(frames))
+    chip8.load_game(rom_path)
+    chip8.initialize()
+    if engine in TOOLS:
+        TOOLS[engine](chip8)
+    else:
+        engines.attach(chip8, engine)
+
+    # Run in chunks of whole frames rather than with a frame hook,
+    # so halted machines still fast-forward
+    hashes = {}
+    error = None
+    chunk = settings["every"] * chip8.cycles_per_frame
+    try:
+        while chip8.cycle_count < settings["cycles"]:
+            chip8.run(min(chunk, settings["cycles"] - chip8.cycle_count))
+            if chip8.frame_count % settings["every"] == 0:
+                hashes[str(chip8.frame_count)] = frame_hash(chip8.screen)
+    except (IndexError, ValueError) as e:
+        error = f"{type(e).__name__}: {e}"
+
+    return {
+        "frames": hashes,
+        "error": error,
+        "state": hashlib.sha256(chip8.save_state()).hexdigest()[:16],
+    }
+
+
+def run_batch(rom_path, settings):
+    # Hashes of the screen every `every` frames and whether the machine
+    # halted, a BatchChip8 halts a crashed machine instead of raising
+    from chip8.batch import BatchChip8
+    batch = BatchChip8(1, seeds=[settings["seed"]])
+    frames = settings["cycles"] // batch.cycles_per_frame + 1
+    batch.frontend = BatchScriptedFrontend(ScriptedFrontend.round_robin(frames))
+    batch.load_game(rom_path)
+
+    hashes = {}
+    chunk = settings["every"] * batch.cycles_per_frame
+    while batch.cycle_count < settings["cycles"] and not batch.halted[0]:
+        batch.run(min(chunk, settings["cycles"] - batch.cycle_count))
+        if batch.frame_count % settings["every"] == 0 and not batch.halted[0]:
+            hashes[str(batch.frame_count)] = frame_hash(batch.framebuffer(0))
+
+    return {"frames": hashes, "halted": bool(batch.halted[0])}
+
+
+def matches(expected, result):
+    if "halted" in result:
+        # The batch machine can't tell why it stopped, only that it did
+        return result["frames"] == expected["frames"] and result["halted"] == (expected["error"] is not None)
+    return all(result[key] == expected[key] for key in result)
+
+
+def first_difference(expected, result):
+    # Where a result stops matching its golden values, as text
+    for frame, frame_hash_value in expected["frames"].items():
+        if result["frames"].get(frame) != frame_hash_value:
+            return f"screen differs at frame {frame}"
+    if result["frames"].keys() != expected["frames"].keys():
+        return "screen hashed at different frames"
+    if "halted" in result:
+        return f"halted, expected {expected['error']}" if result["halted"] else f"ran on, expected {expected['error']}"
+    if result["error"] != expected["error"]:
+        return f"stopped with {result['error']}, expected {expected['error']}"
+    return "final state differs"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that every engine draws the golden frames of every ROM")
+    parser.add_argument("roms", nargs="*", help="ROM files, all of games/ by default")
+    parser.add_argument("--engine", action="append", choices=sorted(ENGINES),
+                        help="engine to check, can be repeated, all but batch by default")
+    parser.add_argument("--golden", default=GOLDEN_PATH, help="golden values, games/golden.json by default")
+    parser.add_argument("--update", action="store_true",
+                        help="record new golden values with the interpreter instead of checking")
+    args = parser.parse_args()
+
+    rom_paths = args.roms or sorted(glob.glob(os.path.join(GAMES_DIRECTORY, "*.ch8")))
+    try:
+        with open(args.golden) as f:
+            golden = json.load(f)
+    except FileNotFoundError:
+        golden = {}
+
+    start = time.perf_counter()
+    if args.update:
+        for rom_path in rom_paths:
+            name = os.path.basename(rom_path)
+            entry = golden.get(name, {})
+            settings = {
+                "cycles": entry.get("cycles", DEFAULT_CYCLES),
+                "every": entry.get("every", DEFAULT_EVERY),
+                "seed": entry.get("seed", DEFAULT_SEED),
+            }
+            golden[name] = dict(settings, **run_rom(rom_path, settings, "interpreter"))
+            print(f"{name:<18} {len(golden[name]['frames'])} frames recorded", file=sys.stderr)
+        with open(args.golden, "w") as f:
+            json.dump(dict(sorted(golden.items())), f, indent=1)
+            f.write("\n")
+        return
+
+    failures = 0
+    for rom_path in rom_paths:
+        name = os.path.basename(rom_path)
+        if name not in golden:
+            print(f"{name:<18} no golden values, record them with --update", file=sys.stderr)
+            failures += 1
+            continue
+        expected = golden[name]
+        for engine in args.engine or DEFAULT_ENGINES:
+            result = run_rom(rom_path, expected, engine)
+            if matches(expected, result):
+                caveat = f" ({CAVEATS[engine]})" if engine in CAVEATS else ""
+                print(f"{name:<18} {engine:<12} ok{caveat}", file=sys.stderr)
+            else:
+                print(f"{name:<18} {engine:<12} FAILED, {first_difference(expected, result)}", file=sys.stderr)
+                failures += 1
+
+    print(f"{failures} failures in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import unittest
+
+from chip8.chip8 import Chip8
+from chip8.frontend import HeadlessFrontend
+
+try:
+    from chip8.batch import BatchChip8
+except ImportError:
+    BatchChip8 = None
+
+
+def program(instructions):
+    return b"".join(instruction.to_bytes(2, "big") for instruction in instructions)
+
+
+@unittest.skipIf(BatchChip8 is None, "needs numpy")
+class BatchChip8Test(unittest.TestCase):
+
+    def assert_same_as_chip8(self, rom, cycles):
+        chip8 = Chip8(frontend=HeadlessFrontend(), seed=1)
+        chip8.initialize()
+        chip8.load_rom(rom)
+        chip8.run(cycles)
+
+        batch = BatchChip8(1, seeds=[1])
+        batch.load_rom(rom)
+        batch.run(cycles)
+
+        self.assertEqual([int(v) for v in batch.V[0]], chip8.V)
+        self.assertEqual(int(batch.PC[0]), chip8.PC)
+        self.assertEqual(int(batch.I[0]), chip8.I)
+
+    def test_alu_with_vf_as_x(self):
+        # Every 8XY_ that sets VF, with VF as the destination too
+        for op_code in (0x8FF4, 0x8FF5, 0x8FF6, 0x8FF7, 0x8FFE, 0x8F14, 0x8F15, 0x8F16, 0x8F17, 0x8F1E):
+            with self.subTest(op_code=hex(op_code)):
+                rom = program([0x6F83, 0x61C1, op_code, 0x1206])
+                self.assert_same_as_chip8(rom, 4)
+
+    def test_shl_vf(self):
+        # 8FFE with VF = 0x83 leaves 2 in VF
+        batch = BatchChip8(1, seeds=[1])
+        batch.load_rom(program([0x6F83, 0x8FFE, 0x1204]))
+        batch.run(2)
+        self.assertEqual(int(batch.V[0, 0xF]), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
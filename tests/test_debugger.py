@@ -0,0 +1,67 @@
+import unittest
+
+import chip8.constants as constants
+from chip8.chip8 import Chip8
+from chip8.debugger import Break, Debugger
+from chip8.frontend import HeadlessFrontend
+
+CYCLES_PER_FRAME = max(1, constants.CLOCK_SPEED // constants.TIMER_SPEED)
+
+
+def machine(instructions):
+    chip8 = Chip8(frontend=HeadlessFrontend(), seed=1)
+    chip8.initialize()
+    chip8.load_rom(b"".join(instruction.to_bytes(2, "big") for instruction in instructions))
+    return chip8
+
+
+class DebuggerTest(unittest.TestCase):
+
+    def test_watchpoint_on_last_instruction_of_frame(self):
+        # FX55 is the last instruction of the first frame
+        last = 0x200 + 2 * (CYCLES_PER_FRAME - 1)
+        chip8 = machine([0xA300] + [0x6005] * (CYCLES_PER_FRAME - 2) + [0xF055, 0x1000 | (last + 2)])
+        debugger = Debugger(chip8)
+        debugger.add_watchpoint(0x300, read=False)
+
+        with self.assertRaises(Break) as hit:
+            chip8.run_frame()
+        self.assertEqual(hit.exception.reason, "watchpoint")
+        self.assertEqual(hit.exception.pc, last)
+        self.assertEqual(chip8.frame_count, 1)
+        self.assertEqual(chip8.frame_cycle, 0)
+        self.assertEqual(chip8.cycle_count, CYCLES_PER_FRAME)
+
+        # Continuing runs whole frames again
+        chip8.run_frame()
+        chip8.run_frame()
+        self.assertEqual(chip8.frame_count, 3)
+        self.assertEqual(chip8.cycle_count, 3 * CYCLES_PER_FRAME)
+
+    def test_breakpoint_resumes(self):
+        chip8 = machine([0x6001, 0x6102, 0x1204])
+        debugger = Debugger(chip8)
+        debugger.add_breakpoint(0x202)
+
+        with self.assertRaises(Break) as hit:
+            chip8.run(10)
+        self.assertEqual(hit.exception.pc, 0x202)
+        self.assertEqual(chip8.V[:2], [1, 0])
+        chip8.run(1)
+        self.assertEqual(chip8.V[:2], [1, 2])
+
+    def test_condition_attributes_and_comprehensions(self):
+        check = Debugger.compile_condition("keys.count(True) == 1 and any(v == 3 for v in V)")
+        chip8 = machine([0x1200])
+        self.assertFalse(check(chip8))
+        chip8.keys[4] = True
+        chip8.V[7] = 3
+        self.assertTrue(check(chip8))
+
+    def test_condition_unknown_name(self):
+        with self.assertRaises(ValueError):
+            Debugger.compile_condition("X == 1")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import unittest
+
+import chip8.constants as constants
+from chip8.chip8 import Chip8
+from chip8.frontend import ScriptedFrontend
+from chip8.rewind import Rewind
+
+GAMES_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "games")
+
+
+def machine(frames=600):
+    chip8 = Chip8(frontend=ScriptedFrontend(ScriptedFrontend.round_robin(frames)), seed=1)
+    chip8.load_game(os.path.join(GAMES_DIRECTORY, "pong.ch8"))
+    chip8.initialize()
+    return chip8
+
+
+def run_frames(chip8, frames, states):
+    # The state at the end of every frame, as Rewind records it
+    for _ in range(frames):
+        chip8.run_frame()
+        states.append(chip8.save_state())
+
+
+class RewindTest(unittest.TestCase):
+
+    def test_rewind_across_keyframes(self):
+        chip8 = machine()
+        rewind = Rewind(chip8, seconds=2, keyframe_interval=10)
+        states = []
+        run_frames(chip8, 100, states)
+
+        self.assertEqual(rewind.rewind(frames=25), 25)
+        self.assertEqual(chip8.save_state(), states[-26])
+        self.assertEqual(chip8.frame_count, 75)
+
+    def test_recording_goes_on_after_rewind(self):
+        chip8 = machine()
+        rewind = Rewind(chip8, seconds=2, keyframe_interval=10)
+        states = []
+        run_frames(chip8, 50, states)
+        rewind.rewind(frames=13)
+        del states[-13:]
+
+        run_frames(chip8, 30, states)
+        self.assertEqual(rewind.rewind(frames=40), 40)
+        self.assertEqual(chip8.save_state(), states[-41])
+
+    def test_rewind_stops_at_the_oldest_frame(self):
+        chip8 = machine()
+        rewind = Rewind(chip8, seconds=1, keyframe_interval=10)
+        states = []
+        run_frames(chip8, 2 * constants.TIMER_SPEED, states)
+
+        frames = constants.TIMER_SPEED
+        self.assertEqual(len(rewind), frames)
+        self.assertEqual(rewind.rewind(frames=2 * frames), frames - 1)
+        self.assertEqual(chip8.save_state(), states[-frames])
+        self.assertEqual(rewind.rewind(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
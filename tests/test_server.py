@@ -0,0 +1,100 @@
+import asyncio
+import random
+import unittest
+
+from chip8.framebuffer import FrameBuffer
+from chip8.server import BEEP, KEYFRAME_INTERVAL, Client, read_message
+
+
+class BufferWriter:
+    # Collects what a Client writes, with nothing ever left unsent
+    def __init__(self):
+        self.data = bytearray()
+        self.transport = self
+
+    def write(self, data):
+        self.data += data
+
+    def get_write_buffer_size(self):
+        return 0
+
+
+def read_messages(data, screen):
+    # Kinds of the messages in data, applied to screen in order
+    async def read_all():
+        reader = asyncio.StreamReader()
+        reader.feed_data(bytes(data))
+        reader.feed_eof()
+        kinds = []
+        while not reader.at_eof():
+            kinds.append(await read_message(reader, screen))
+        return kinds
+    return asyncio.run(read_all())
+
+
+def frames(count, seed=1):
+    # Screens that change a few rows at a time, like a game
+    rng = random.Random(seed)
+    rows = [rng.getrandbits(64) for _ in range(FrameBuffer.HEIGHT)]
+    for _ in range(count):
+        for _ in range(rng.randrange(4)):
+            rows[rng.randrange(FrameBuffer.HEIGHT)] = rng.getrandbits(64)
+        yield list(rows)
+
+
+class ProtocolTest(unittest.TestCase):
+
+    def test_keyframe_then_deltas(self):
+        writer = BufferWriter()
+        client = Client(writer)
+        screen = FrameBuffer()
+        for number, rows in enumerate(frames(KEYFRAME_INTERVAL), 1):
+            client.send(number, rows)
+            kinds = read_messages(writer.data, screen)
+            writer.data.clear()
+            if number == 1:
+                self.assertEqual(kinds, [b"K"])
+            else:
+                self.assertIn(kinds, ([b"D"], []))
+            self.assertEqual(screen.rows, rows)
+
+    def test_unchanged_frame_sends_nothing(self):
+        writer = BufferWriter()
+        client = Client(writer)
+        rows = next(frames(1))
+        client.send(1, rows)
+        writer.data.clear()
+        client.send(2, rows)
+        self.assertEqual(writer.data, b"")
+
+    def test_keyframe_every_interval(self):
+        writer = BufferWriter()
+        client = Client(writer)
+        screen = FrameBuffer()
+        # Keyframes at frame 1 and after every KEYFRAME_INTERVAL frames since
+        for number, rows in enumerate(frames(2 * (KEYFRAME_INTERVAL + 1) + 1), 1):
+            client.send(number, rows)
+        kinds = read_messages(writer.data, screen)
+        self.assertEqual(kinds.count(b"K"), 3)
+        self.assertEqual(screen.rows, rows)
+
+    def test_beep_between_frames(self):
+        writer = BufferWriter()
+        client = Client(writer)
+        screen = FrameBuffer()
+        sent = list(frames(3))
+        client.send(1, sent[0])
+        writer.write(BEEP)
+        client.send(2, sent[1])
+        client.send(3, sent[2])
+        kinds = read_messages(writer.data, screen)
+        self.assertEqual(kinds[:2], [b"K", BEEP])
+        self.assertEqual(screen.rows, sent[2])
+
+    def test_unknown_message(self):
+        with self.assertRaises(ValueError):
+            read_messages(b"X", FrameBuffer())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import unittest
+
+from chip8.chip8 import Chip8
+from chip8.frontend import ScriptedFrontend
+
+GAMES_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "games")
+
+
+def machine(frames=600):
+    chip8 = Chip8(frontend=ScriptedFrontend(ScriptedFrontend.round_robin(frames)), seed=1)
+    chip8.load_game(os.path.join(GAMES_DIRECTORY, "pong.ch8"))
+    chip8.initialize()
+    return chip8
+
+
+class SaveStateTest(unittest.TestCase):
+
+    def test_load_state_puts_back_what_was_saved(self):
+        chip8 = machine()
+        for _ in range(100):
+            chip8.run_frame()
+        state = chip8.save_state()
+
+        for _ in range(100):
+            chip8.run_frame()
+        self.assertNotEqual(chip8.save_state(), state)
+
+        chip8.load_state(state)
+        self.assertEqual(chip8.save_state(), state)
+        self.assertEqual(chip8.frame_count, 100)
+
+    def test_loaded_state_runs_on_the_same(self):
+        chip8 = machine()
+        for _ in range(100):
+            chip8.run_frame()
+        state = chip8.save_state()
+
+        copy = machine()
+        copy.load_state(state)
+        for _ in range(200):
+            chip8.run_frame()
+            copy.run_frame()
+        self.assertEqual(copy.save_state(), chip8.save_state())
+        self.assertEqual(copy.screen.rows, chip8.screen.rows)
+
+    def test_snapshot_and_restore(self):
+        chip8 = machine()
+        for _ in range(100):
+            chip8.run_frame()
+        state = chip8.save_state()
+        snapshot = chip8.snapshot()
+
+        for _ in range(100):
+            chip8.run_frame()
+        chip8.restore(snapshot)
+        self.assertEqual(chip8.save_state(), state)
+
+    def test_invalid_state(self):
+        chip8 = machine()
+        state = chip8.save_state()
+        with self.assertRaises(ValueError):
+            chip8.load_state(state[:-1])
+        with self.assertRaises(ValueError):
+            chip8.load_state(b"XXXX" + state[4:])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+
+import chip8.constants as constants
+from chip8.chip8 import Chip8
+from chip8.frontend import ScriptedFrontend
+from chip8.video import VideoRecorder, read_video
+
+GAMES_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "games")
+
+
+def machine(frames=600):
+    chip8 = Chip8(frontend=ScriptedFrontend(ScriptedFrontend.round_robin(frames)), seed=1)
+    chip8.load_game(os.path.join(GAMES_DIRECTORY, "pong.ch8"))
+    chip8.initialize()
+    return chip8
+
+
+def read_frames(path):
+    # The screen of every frame in a video file
+    fps, screens = read_video(path)
+    frames = []
+    for start, end, rows in screens:
+        frames.extend([rows] * (end - start))
+    return fps, frames
+
+
+class VideoTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "session.c8v")
+
+    def test_every_frame_read_back(self):
+        chip8 = machine()
+        recorder = VideoRecorder(chip8)
+        screens = [tuple(chip8.screen.rows)]
+        for _ in range(300):
+            chip8.run_frame()
+            screens.append(tuple(chip8.screen.rows))
+        recorder.save(self.path)
+
+        fps, frames = read_frames(self.path)
+        self.assertEqual(fps, constants.TIMER_SPEED)
+        self.assertEqual(frames, screens)
+
+    def test_recording_goes_on_after_save(self):
+        chip8 = machine()
+        recorder = VideoRecorder(chip8)
+        screens = [tuple(chip8.screen.rows)]
+        for _ in range(2):
+            for _ in range(100):
+                chip8.run_frame()
+                screens.append(tuple(chip8.screen.rows))
+            recorder.save(self.path)
+            self.assertEqual(read_frames(self.path)[1], screens)
+
+    def test_long_still(self):
+        # Longer than one record can skip
+        chip8 = machine()
+        recorder = VideoRecorder(chip8)
+        for _ in range(10):
+            chip8.run_frame()
+        for _ in range(70000):
+            recorder.record(chip8)
+        recorder.save(self.path)
+
+        frames = read_frames(self.path)[1]
+        self.assertEqual(len(frames), 70011)
+        self.assertEqual(frames[-1], tuple(chip8.screen.rows))
+
+    def test_not_a_video(self):
+        with open(self.path, "wb") as f:
+            f.write(b"not a video")
+        with self.assertRaises(ValueError):
+            read_video(self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()